@@ -1,44 +1,196 @@
-import spacy
 import logging
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import hashlib
+import threading
+import time
+import unicodedata
+import numpy as np
+from importlib.metadata import version, PackageNotFoundError
+from config import (SPACY_MODEL, SPACY_EXCLUDED_COMPONENTS, SPACY_BATCH_SIZE, SPACY_N_PROCESS,
+                    ANALYSIS_CACHE_VERSION)
+from metrics import span, increment, observe
 
-# Load spaCy model
-try:
-    nlp = spacy.load('en_core_web_sm')
-except Exception as e:
-    logging.error(f"Error loading spaCy model: {e}")
-    raise
+# NLP models loaded on first use and shared by every thread and session of the process, so
+# read-only pages and fully cached refreshes never pay for importing spaCy or loading a model
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
 
-# Extract tags from review text using spaCy
+# Return the model stored under name, loading it with loader the first time it is needed
+def _load_model(name, loader):
+    model = _MODELS.get(name)
+    if model is not None:
+        return model
+    with _MODELS_LOCK:
+        model = _MODELS.get(name)
+        if model is None:
+            start_time = time.perf_counter()
+            model = loader()
+            seconds = time.perf_counter() - start_time
+            observe('model_load', seconds)
+            logging.info(f"Loaded {name} in {seconds:.2f} seconds")
+            _MODELS[name] = model
+    return model
+
+# Load the spaCy pipeline without the components tag extraction doesn't use (noun chunks need
+# the tagger and parser, entities the NER)
+def _load_spacy():
+    import spacy
+    try:
+        return spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDED_COMPONENTS)
+    except Exception as e:
+        logging.error(f"Error loading spaCy model: {e}")
+        raise
+
+# Load the VADER sentiment analyzer
+def _load_vader():
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+# Shared spaCy pipeline
+def get_nlp():
+    return _load_model(SPACY_MODEL, _load_spacy)
+
+# Shared VADER analyzer, so the lexicon is parsed once per process
+def get_sentiment_analyzer():
+    return _load_model('vader', _load_vader)
+
+# Compound score thresholds used to label sentiment
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+# Installed version of a package, or 'unknown'
+def _package_version(package):
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return 'unknown'
+
+# Identifies the analysis results: part of every analysis cache key, so upgrading the spaCy model or
+# VADER, changing the thresholds or bumping ANALYSIS_CACHE_VERSION invalidates cached results
+ANALYZER_VERSION = (f"{SPACY_MODEL}-{_package_version(SPACY_MODEL)}|vader-{_package_version('vaderSentiment')}"
+                    f"|{POSITIVE_THRESHOLD}|{NEGATIVE_THRESHOLD}|{ANALYSIS_CACHE_VERSION}")
+
+# Collect noun chunk and entity tags from a processed spaCy doc
+def _tags_from_doc(doc):
+    tags = set()
+    for chunk in doc.noun_chunks:
+        tag = chunk.text.replace(' ', '-')
+        if len(tag) > 2:
+            tags.add(tag)
+    for ent in doc.ents:
+        tag = ent.text.replace(' ', '-')
+        if len(tag) > 2:
+            tags.add(tag)
+    return list(tags)
+
+# Extract tags from review text using spaCy. A model that cannot be loaded raises instead of
+# yielding empty tags, which would otherwise end up in the analysis cache.
 def extract_tags_from_review(review_text):
+    if not review_text:
+        return []
+    nlp = get_nlp()
     try:
-        if not review_text:
-            return []
         doc = nlp(review_text.lower())
-        tags = set()
-        for chunk in doc.noun_chunks:
-            tag = chunk.text.replace(' ', '-')
-            if len(tag) > 2:
-                tags.add(tag)
-        for ent in doc.ents:
-            tag = ent.text.replace(' ', '-')
-            if len(tag) > 2:
-                tags.add(tag)
-        return list(tags)
+        return _tags_from_doc(doc)
     except Exception as e:
         logging.error(f"Error extracting tags from review: {e}")
         return []
 
+# Extract tags from many review texts using nlp.pipe; returns one tag list per text, in order
+def extract_tags_from_reviews(review_texts, batch_size=SPACY_BATCH_SIZE, n_process=SPACY_N_PROCESS):
+    texts = [text.lower() if text else '' for text in review_texts]
+    tags = [None] * len(texts)
+    if not any(texts):
+        return [[] for _ in texts]
+    nlp = get_nlp()
+    with span('spacy_extract', items=len(texts)):
+        try:
+            docs = nlp.pipe(((text, index) for index, text in enumerate(texts) if text),
+                            as_tuples=True, batch_size=batch_size, n_process=n_process)
+            for doc, index in docs:
+                tags[index] = _tags_from_doc(doc)
+        except Exception as e:
+            logging.error(f"Error extracting tags in batch, falling back to single reviews: {e}")
+        return [extracted if extracted is not None else extract_tags_from_review(text)
+                for extracted, text in zip(tags, texts)]
+
+# Map compound scores to sentiment labels
+def _sentiment_labels(scores):
+    return np.select([scores >= POSITIVE_THRESHOLD, scores <= NEGATIVE_THRESHOLD],
+                     ['Positive', 'Negative'], default='Neutral').astype(object)
+
 # Analyze sentiment of a review text
 def analyze_sentiment(review_text):
     try:
-        analyzer = SentimentIntensityAnalyzer()
         if review_text:
-            score = analyzer.polarity_scores(review_text)
+            score = get_sentiment_analyzer().polarity_scores(review_text)
             compound = score['compound']
-            sentiment = 'Positive' if compound >= 0.05 else 'Negative' if compound <= -0.05 else 'Neutral'
+            sentiment = 'Positive' if compound >= POSITIVE_THRESHOLD else 'Negative' if compound <= NEGATIVE_THRESHOLD else 'Neutral'
             return sentiment, compound
         return 'Neutral', 0.0
     except Exception as e:
         logging.error(f"Error analyzing sentiment: {e}")
         return 'Neutral', 0.0
+
+# Analyze sentiment of many review texts; returns NumPy arrays of labels and compound scores
+def analyze_sentiments(review_texts):
+    review_texts = list(review_texts)
+    scores = np.zeros(len(review_texts), dtype=np.float64)
+    sentiment_analyzer = get_sentiment_analyzer() if any(review_texts) else None
+    with span('sentiment', items=len(review_texts)):
+        for index, review_text in enumerate(review_texts):
+            if not review_text:
+                continue
+            try:
+                scores[index] = sentiment_analyzer.polarity_scores(review_text)['compound']
+            except Exception as e:
+                logging.error(f"Error analyzing sentiment: {e}")
+    return _sentiment_labels(scores), scores
+
+# Normalize review text for analysis and the analysis cache: Unicode NFC with whitespace runs collapsed.
+# Texts are analyzed in this form, so texts with the same cache key get the same sentiment and tags.
+def _normalize_text(review_text):
+    return ' '.join(unicodedata.normalize('NFC', review_text).split())
+
+# Analysis cache key of a review text
+def analysis_cache_key(review_text):
+    key = f"{ANALYZER_VERSION}\n{_normalize_text(review_text)}"
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+# Sentiment labels, compound scores and extracted tags of many review texts. Results are looked up
+# with load_cached first (e.g. db.get_cached_analyses); only texts that are not cached go through VADER
+# and spaCy, and their results and the used hits are stored with save_cached (db.save_cached_analyses).
+def analyze_reviews(review_texts, load_cached=None, save_cached=None):
+    review_texts = list(review_texts)
+    keys = [analysis_cache_key(text) if text else None for text in review_texts]
+    cached, used = {}, []
+    if load_cached:
+        try:
+            cached, used = load_cached({key for key in keys if key})
+        except Exception as e:
+            logging.error(f"Error reading the analysis cache: {e}")
+
+    missing = {}
+    for key, text in zip(keys, review_texts):
+        if key and key not in cached and key not in missing:
+            missing[key] = _normalize_text(text)
+    entries = []
+    if missing:
+        texts = list(missing.values())
+        labels, scores = analyze_sentiments(texts)
+        extracted = extract_tags_from_reviews(texts)
+        entries = list(zip(missing.keys(), labels, scores, extracted))
+        for key, label, score, tags in entries:
+            cached[key] = (label, score, tags)
+    if save_cached:
+        try:
+            save_cached(entries, used=used)
+        except Exception as e:
+            logging.error(f"Error writing the analysis cache: {e}")
+    increment('analysis_cache_lookups', len(keys) - keys.count(None) - len(missing), result='hit')
+    increment('analysis_cache_lookups', len(missing), result='miss')
+    logging.info(f"Analyzed {len(review_texts)} reviews ({len(missing)} not in the analysis cache)")
+
+    scores = np.array([cached[key][1] if key else 0.0 for key in keys], dtype=np.float64)
+    labels = np.array([cached[key][0] if key else 'Neutral' for key in keys], dtype=object)
+    tags = [list(cached[key][2]) if key else [] for key in keys]
+    return labels, scores, tags
@@ -1,9 +1,6 @@
 import streamlit as st
 
-from db import get_app_ids, add_app_id, clear_reviews_cache
-import spacy
-from spacy.cli import download
-import os
+from db import get_app_ids, add_app_id
 # Configure the app to collapse the default sidebar and use a custom navigation
 
 
@@ -12,6 +9,7 @@ from pages.home import show_home
 from pages.reviews import show_reviews
 from pages.trends import show_trends
 from pages.tags import show_tags
+from pages.diagnostics import show_diagnostics
 
 st.set_page_config(
     page_title="Play Store Review Analyzer",
@@ -24,9 +22,6 @@ with open('./style.css') as f:
 
 st.markdown(f'<style>{css}</style>', unsafe_allow_html=True)
 
-# Clear cache on app start to ensure fresh data
-clear_reviews_cache()
-
 st.title("Play Store Review Analyzer")
 
 # Fetch app IDs from the database
@@ -49,7 +44,7 @@ with st.sidebar.expander("Add New App", expanded=False):
 
 # Custom navigation in the sidebar
 st.sidebar.header("Navigation")
-page = st.sidebar.selectbox("Choose a page", ["Home", "Reviews", "Trends", "Tags"])
+page = st.sidebar.selectbox("Choose a page", ["Home", "Reviews", "Trends", "Tags", "Diagnostics"])
 
 # Render the selected page
 if page == "Home":
@@ -60,3 +55,5 @@ elif page == "Trends":
     show_trends(app_id)
 elif page == "Tags":
     show_tags(app_id)
+elif page == "Diagnostics":
+    show_diagnostics(app_id)
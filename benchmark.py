@@ -0,0 +1,337 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# End-to-end benchmarks on a deterministic synthetic corpus, fully offline:
+#   python benchmark.py --sizes 1000,100000,1000000 --output baseline.json
+#   python benchmark.py --sizes 1000 --baseline baseline.json
+# Runs against a throwaway database and snapshot directory. spaCy/VADER timings (and a cold
+# auto-tag) run on at most --nlp-limit reviews per size; the full-size auto-tag run is warm, i.e.
+# analysis results are already cached, as after a tag rule change. The output also holds the
+# per-stage timings recorded by metrics.py for each size, and the cold-start import and model
+# load times under results['startup'].
+
+# Words that make up synthetic review text
+_FILLER_WORDS = (
+    "the app is it this i my and to a of for on with after update every time when now just really "
+    "very so but not even still phone account week day money friends new old version screen button "
+    "work works worked open opens login support team review star stars option settings home page "
+    "again please why how today always never sometimes keeps other users experience problem issue"
+).split()
+_POSITIVE_WORDS = "good great love excellent nice amazing helpful best awesome happy".split()
+_NEGATIVE_WORDS = "bad terrible hate awful worst useless annoying horrible disappointed poor".split()
+
+
+# Deterministic synthetic reviews in google_play_scraper's format. Review i is derived from its own
+# seeded RNG, so any page can be generated on demand without holding the corpus in memory.
+class SyntheticReviews:
+    def __init__(self, size, seed=42, mean_words=25, tag_density=0.3, tag_rules=None,
+                 newest=datetime(2025, 1, 1), interval_seconds=60):
+        self.size = size
+        self.seed = seed
+        self.mean_words = mean_words
+        self.tag_density = tag_density
+        self.keywords = sorted({keyword for keywords in (tag_rules or {}).values() for keyword in keywords})
+        self.newest = newest
+        self.interval_seconds = interval_seconds
+
+    def __len__(self):
+        return self.size
+
+    # Review i (0 is the newest)
+    def review(self, index):
+        rng = random.Random(f"{self.seed}-{index}")
+        rating = rng.choices([1, 2, 3, 4, 5], weights=[20, 8, 10, 17, 45])[0]
+        if rng.random() < 0.03:
+            content = ''
+        else:
+            # Log-normal length distribution around mean_words, like real review lengths
+            words = max(1, min(400, int(rng.lognormvariate(math.log(self.mean_words), 0.8))))
+            tokens = rng.choices(_FILLER_WORDS, k=words)
+            mood = _POSITIVE_WORDS if rating >= 4 else _NEGATIVE_WORDS if rating <= 2 else _FILLER_WORDS
+            for _ in range(1 + words // 15):
+                tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(mood))
+            if self.keywords and rng.random() < self.tag_density:
+                for keyword in rng.sample(self.keywords, k=min(len(self.keywords), rng.randint(1, 3))):
+                    tokens.insert(rng.randrange(len(tokens) + 1), keyword)
+            content = ' '.join(tokens).capitalize() + '.'
+        return {
+            'reviewId': f"bench-{self.seed}-{index}",
+            'userName': f"user{rng.randrange(max(1, self.size // 3))}",
+            'content': content,
+            'score': rating,
+            'at': self.newest - timedelta(seconds=index * self.interval_seconds),
+        }
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield self.review(index)
+
+
+# Offline stand-in for fetcher.fetch_reviews_page serving newest-first pages of a synthetic corpus
+# with real continuation tokens
+class ScraperStub:
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.requests = 0
+
+    def __call__(self, app_id, lang='en', country='us', sort=None, count=100, filter_score_with=None,
+                 filter_device_with=None, continuation_token=None):
+        from google_play_scraper.features.reviews import _ContinuationToken
+        self.requests += 1
+        if continuation_token is not None:
+            if continuation_token.token is None:
+                return [], continuation_token
+            offset, count = int(continuation_token.token), continuation_token.count
+        else:
+            offset = 0
+        end = min(offset + count, len(self.corpus))
+        page = [self.corpus.review(index) for index in range(offset, end)]
+        next_token = str(end) if end < len(self.corpus) else None
+        return page, _ContinuationToken(next_token, lang, country, getattr(sort, 'value', sort), count,
+                                        filter_score_with, filter_device_with)
+
+
+# Time fn() and record seconds and throughput under name; returns fn's result
+def _timed(results, name, fn, items):
+    start_time = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start_time
+    results[name] = {'seconds': round(seconds, 6), 'items': items,
+                     'items_per_sec': round(items / seconds, 1) if seconds > 0 else None}
+    print(f"  {name:<32} {seconds:10.3f}s  {results[name]['items_per_sec'] or 0:>12,.0f} items/s", file=sys.stderr)
+    return result
+
+
+# Store the corpus as already-analyzed reviews (synthetic sentiment, no tags), in chunks
+def _load_corpus(app_id, corpus, chunk_size=5000):
+    import pandas as pd
+    from db import save_reviews
+    from utils import _clean_review
+    for start in range(0, len(corpus), chunk_size):
+        rows = [_clean_review(app_id, corpus.review(index)) for index in range(start, min(start + chunk_size, len(corpus)))]
+        batch = pd.DataFrame(rows)
+        batch['sentiment'] = ['Positive' if rating >= 4 else 'Negative' if rating <= 2 else 'Neutral'
+                              for rating in batch['rating']]
+        batch['sentiment_score'] = (batch['rating'] - 3) / 2.0
+        batch['tags'] = None
+        save_reviews(app_id, batch)
+
+
+# Fill the analysis cache for every stored review without running NLP (for the warm auto-tag run)
+def _seed_analysis_cache(app_id, chunk_size=5000):
+    from analyzer import analysis_cache_key
+    from db import load_review_texts, save_cached_analyses
+    texts = [text for _, text in load_review_texts(app_id) if text]
+    for start in range(0, len(texts), chunk_size):
+        entries = []
+        for text in texts[start:start + chunk_size]:
+            words = [word.strip('.').lower() for word in text.split()]
+            entries.append((analysis_cache_key(text), 'Neutral', 0.0, sorted(set(words[:2]))))
+        save_cached_analyses(entries)
+
+
+# Searches slower than this fail the run: the Reviews page search has to stay interactive
+SEARCH_MAX_SECONDS = 1.0
+
+# Check that SQLite's search query is driven by the full-text index. When the planner puts reviews
+# first it runs the MATCH once per review of the app, which is seconds instead of milliseconds.
+def _check_search_plan(app_id, query):
+    from db import get_connection, _BACKEND
+    if _BACKEND.name != 'sqlite':
+        return
+    search = _BACKEND.search_clauses(query)
+    with get_connection() as conn:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM {search['from']} "
+                            f"WHERE {search['match']} AND r.app_id = ?", (search['query'], app_id)).fetchall()
+    assert 'reviews_fts' in plan[0][-1], f"search query doesn't start from the search index: {plan}"
+
+
+# Run every benchmark for one corpus size; returns {benchmark: timing}
+def run_size(size, seed, mean_words, tag_density, nlp_limit):
+    import fetcher
+    from config import DEFAULT_TAGS
+    from ratelimit import AdaptiveRateLimiter
+    from analyzer import analyze_sentiment, analyze_sentiments, extract_tags_from_review, extract_tags_from_reviews
+    from tagger import auto_tag_reviews, save_tag_rule, remove_tag_rule
+    from snapshot import snapshot_path
+    from db import (add_app_id, add_tag_rule, clear_reviews_cache, get_reviews, write_review_snapshot,
+                    get_review_summary, get_daily_review_stats, get_tag_counts, get_daily_tag_counts,
+                    get_reviews_page, search_reviews)
+
+    app_id = f"bench.app{size}"
+    tag_rules = DEFAULT_TAGS['cashgiraffe.app']
+    corpus = SyntheticReviews(size, seed=seed, mean_words=mean_words, tag_density=tag_density, tag_rules=tag_rules)
+    nlp_size = min(size, nlp_limit) if nlp_limit else size
+    results = {}
+    print(f"{size:,} reviews (NLP on {nlp_size:,})", file=sys.stderr)
+
+    # Fetch through the stub, without rate limiting
+    fetcher.fetch_reviews_page = ScraperStub(corpus)
+    unlimited = AdaptiveRateLimiter(1e9, 1e9, 1e9, 1e9, 0, 1)
+    fetched = _timed(results, 'fetch_all_reviews',
+                     lambda: fetcher.fetch_all_reviews(app_id, batch_size=100, rate_limiter=unlimited), size)
+    assert len(fetched) == size, f"fetched {len(fetched)} of {size} reviews"
+    sample = [review['content'] for review in fetched[:nlp_size]]
+    del fetched
+
+    _timed(results, 'analyze_sentiment', lambda: [analyze_sentiment(text) for text in sample], nlp_size)
+    _timed(results, 'analyze_sentiments', lambda: analyze_sentiments(sample), nlp_size)
+    _timed(results, 'extract_tags_from_review', lambda: [extract_tags_from_review(text) for text in sample], nlp_size)
+    _timed(results, 'extract_tags_from_reviews', lambda: extract_tags_from_reviews(sample), nlp_size)
+
+    add_app_id(app_id)
+    for tag_name, keywords in tag_rules.items():
+        add_tag_rule(app_id, tag_name, keywords)
+    _timed(results, 'save_reviews', lambda: _load_corpus(app_id, corpus), size)
+    if size <= nlp_size:
+        _timed(results, 'auto_tag_reviews_cold', lambda: auto_tag_reviews(app_id), size)
+    else:
+        _seed_analysis_cache(app_id)
+    _timed(results, 'auto_tag_reviews_warm', lambda: auto_tag_reviews(app_id), size)
+
+    # Incremental re-tagging after adding, then deleting, a rule (keywords borrowed from an existing rule)
+    _timed(results, 'retag_rule_add', lambda: save_tag_rule(app_id, 'benchmark', tag_rules['payment'][:2]), size)
+    _timed(results, 'retag_rule_delete', lambda: remove_tag_rule(app_id, 'benchmark'), size)
+
+    # get_reviews from SQLite (uncached, then cached) and from the snapshot
+    if os.path.exists(snapshot_path(app_id)):
+        os.remove(snapshot_path(app_id))
+    clear_reviews_cache()
+    _timed(results, 'get_reviews_sqlite', lambda: get_reviews(app_id), size)
+    _timed(results, 'get_reviews_cached', lambda: get_reviews(app_id), size)
+    _timed(results, 'write_review_snapshot', lambda: write_review_snapshot(app_id), size)
+    clear_reviews_cache()
+    _timed(results, 'get_reviews_snapshot', lambda: get_reviews(app_id), size)
+
+    # What the dashboard pages run on every render
+    newest, oldest = corpus.newest.date(), (corpus.newest - timedelta(seconds=size * corpus.interval_seconds)).date()
+    _timed(results, 'home_summary', lambda: (get_review_summary(app_id), get_tag_counts(app_id, limit=5)), size)
+    _timed(results, 'trends_daily_stats',
+           lambda: (get_daily_review_stats(app_id), get_daily_tag_counts(app_id, oldest, newest, top_n=5)), size)
+    first_page, _ = _timed(results, 'reviews_first_page',
+                           lambda: get_reviews_page(app_id, sentiments=['Positive', 'Negative', 'Neutral'],
+                                                    rating_range=(1, 5), tags=['bug', 'payment']), size)
+    if not first_page.empty:
+        last = first_page.iloc[-1]
+        _timed(results, 'reviews_next_page',
+               lambda: get_reviews_page(app_id, sentiments=['Positive', 'Negative', 'Neutral'], rating_range=(1, 5),
+                                        tags=['bug', 'payment'], after=(last['date'], last['review_id'])), size)
+    _timed(results, 'search_reviews', lambda: search_reviews(app_id, 'crash "not working"'), size)
+    _check_search_plan(app_id, 'crash "not working"')
+    assert results['search_reviews']['seconds'] < SEARCH_MAX_SECONDS, \
+        f"search_reviews took {results['search_reviews']['seconds']:.2f}s (limit {SEARCH_MAX_SECONDS}s)"
+    return results
+
+
+# Cold-start cost of the modules the Streamlit pages, scheduler and CLI import, and of loading the
+# NLP models on first use, each measured in a fresh interpreter
+_IMPORT_BENCHMARKS = {
+    'import_db': "import db",
+    'import_analyzer': "import analyzer",
+    'import_utils': "import utils",
+    'import_pages': "import pages.home, pages.reviews, pages.trends, pages.tags, pages.diagnostics",
+    'load_nlp_models': "import analyzer; analyzer.get_nlp(); analyzer.get_sentiment_analyzer()",
+}
+
+# Seconds each _IMPORT_BENCHMARKS snippet takes in a new process (None when it fails)
+def measure_import_times(repeat=3):
+    timings = {}
+    for name, code in _IMPORT_BENCHMARKS.items():
+        script = (f"import time\nstart_time = time.perf_counter()\n{code}\n"
+                  f"print(time.perf_counter() - start_time)")
+        runs = []
+        for _ in range(repeat):
+            try:
+                output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__)), timeout=600).stdout
+                runs.append(float(output.strip().splitlines()[-1]))
+            except Exception as e:
+                print(f"  {name} failed: {e}", file=sys.stderr)
+                break
+        timings[name] = {'seconds': round(min(runs), 6), 'items': 1, 'items_per_sec': None} if len(runs) == repeat else None
+        if timings[name]:
+            print(f"  {name:<32} {timings[name]['seconds']:10.3f}s", file=sys.stderr)
+    return timings
+
+# Print the change of every benchmark against a baseline result file
+def compare(results, baseline):
+    print(f"{'size':>9} {'benchmark':<32} {'baseline':>10} {'current':>10} {'change':>8}", file=sys.stderr)
+    for size, benchmarks in results['results'].items():
+        for name, timing in benchmarks.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if not before:
+                continue
+            change = (timing['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0.0
+            print(f"{size:>9} {name:<32} {before['seconds']:>9.3f}s {timing['seconds']:>9.3f}s {change:>+7.1f}%",
+                  file=sys.stderr)
+
+
+# Git commit of the working tree, if available
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the review pipeline on a synthetic corpus")
+    parser.add_argument('--sizes', default='1000,100000,1000000', help="comma-separated corpus sizes")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mean-words', type=int, default=25, help="typical review length in words")
+    parser.add_argument('--tag-density', type=float, default=0.3, help="share of reviews containing tag keywords")
+    parser.add_argument('--nlp-limit', type=int, default=10000,
+                        help="reviews per size run through spaCy/VADER benchmarks (0 = all)")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    # Point the app at a throwaway database and snapshot directory before anything imports config
+    workdir = tempfile.mkdtemp(prefix='review-benchmark-')
+    os.environ['REVIEWS_DB_PATH'] = os.path.join(workdir, 'reviews.db')
+    os.environ['SNAPSHOT_DIR'] = os.path.join(workdir, 'snapshots')
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'mean_words': args.mean_words,
+            'tag_density': args.tag_density,
+            'nlp_limit': args.nlp_limit,
+        },
+        'results': {},
+    }
+    print("Cold start", file=sys.stderr)
+    results['results']['startup'] = {name: timing for name, timing in measure_import_times().items() if timing}
+
+    from metrics import METRICS
+    results['stages'] = {}
+    for size in sizes:
+        METRICS.reset()
+        results['results'][str(size)] = run_size(size, args.seed, args.mean_words, args.tag_density, args.nlp_limit)
+        results['stages'][str(size)] = METRICS.stage_stats()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output} (database in {workdir})", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
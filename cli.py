@@ -0,0 +1,147 @@
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import REFRESH_MAX_WORKERS, MIGRATION_CHUNK_SIZE
+from progress import event_dict
+
+# Headless entry point for cron and container jobs; never imports streamlit.
+#   python cli.py refresh --app com.whatsapp --workers 4
+#   python cli.py refresh --all --full
+#   python cli.py retag --all
+#   python cli.py migrate
+#   python cli.py --metrics-file /var/lib/node_exporter/reviews.prom refresh --all
+# Progress is written to stdout as JSON lines, one event per line; logs go to stderr. With
+# --metrics-file the per-stage timings of the run are written there in Prometheus text format.
+
+_OUTPUT_LOCK = threading.Lock()
+
+# Write one JSON event line to stdout
+def emit(command, app_id=None, **event):
+    event = {'command': command, 'app_id': app_id, **event}
+    event.setdefault('timestamp', time.time())
+    with _OUTPUT_LOCK:
+        sys.stdout.write(json.dumps(event, default=str) + '\n')
+        sys.stdout.flush()
+
+# update_ui callback that turns progress messages into JSON events
+def _event_callback(command, app_id):
+    def update_ui(message):
+        event = event_dict(message)
+        event.pop('app_id', None)
+        emit(command, app_id, event='progress', **event)
+    return update_ui
+
+# App ids selected with --app/--all
+def _selected_apps(args):
+    from db import get_app_ids
+    if args.all:
+        return get_app_ids()
+    return args.app
+
+# Run command_fn for each app on a pool of workers; returns True when every app succeeded
+def _run_for_apps(command, app_ids, workers, command_fn):
+    def run(app_id):
+        emit(command, app_id, event='started')
+        start_time = time.time()
+        try:
+            ok, result = command_fn(app_id, _event_callback(command, app_id))
+        except Exception as e:
+            logging.exception(f"{command} of {app_id} failed")
+            ok, result = False, {'error': str(e)}
+        result = {key: value for key, value in result.items() if key != 'app_id'}
+        emit(command, app_id, event='finished' if ok else 'failed',
+             elapsed_seconds=round(time.time() - start_time, 3), **result)
+        return ok
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return all(pool.map(run, app_ids))
+
+# Refresh one app as a tracked job (honours the per-app and global job limits)
+def _refresh(args):
+    from scheduler import run_refresh_job
+    from utils import NO_NEW_REVIEWS_MESSAGE
+
+    def refresh_app(app_id, update_ui):
+        summary, message = run_refresh_job(app_id, incremental=not args.full, trigger='cli', update_ui=update_ui)
+        if summary is not None:
+            return True, {**summary, 'message': message}
+        return message == NO_NEW_REVIEWS_MESSAGE, {'message': message}
+
+    return _run_for_apps('refresh', _selected_apps(args), args.workers, refresh_app)
+
+# Re-apply tag rules and extracted tags to every stored review of the selected apps
+def _retag(args):
+    from tagger import auto_tag_reviews
+
+    def retag_app(app_id, update_ui):
+        stats = auto_tag_reviews(app_id, update_ui=update_ui)
+        if stats is None:
+            return True, {'message': f"No tag rules found for {app_id}."}
+        return True, stats
+
+    return _run_for_apps('retag', _selected_apps(args), args.workers, retag_app)
+
+# Copy the SQLite data into PostgreSQL, resuming an interrupted migration unless --restart is given
+def _migrate(args):
+    from migrate import migrate_data
+    emit('migrate', event='started')
+    start_time = time.time()
+    try:
+        summary = migrate_data(chunk_size=args.chunk_size, resume=not args.restart,
+                               update_ui=_event_callback('migrate', None), **({'dsn': args.dsn} if args.dsn else {}))
+    except Exception as e:
+        logging.exception("Migration failed")
+        emit('migrate', event='failed', error=str(e), elapsed_seconds=round(time.time() - start_time, 3))
+        return False
+    emit('migrate', event='finished', elapsed_seconds=round(time.time() - start_time, 3), **summary)
+    return True
+
+# Build the argument parser
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Play Store Review Analyzer batch jobs")
+    parser.add_argument('--metrics-file', help="write per-stage timings in Prometheus text format to this file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text, handler in [('refresh', "fetch, analyze and store reviews", _refresh),
+                                     ('retag', "re-run auto-tagging over stored reviews", _retag)]:
+        command = commands.add_parser(name, help=help_text)
+        apps = command.add_mutually_exclusive_group(required=True)
+        apps.add_argument('--app', action='append', help="app id (repeat for several apps)")
+        apps.add_argument('--all', action='store_true', help="every app in app_ids")
+        command.add_argument('--workers', type=int, default=REFRESH_MAX_WORKERS, help="apps processed in parallel")
+        if name == 'refresh':
+            command.add_argument('--full', action='store_true',
+                                 help="re-download every review and prune removed ones instead of only new reviews")
+        command.set_defaults(handler=handler)
+
+    command = commands.add_parser('migrate', help="copy reviews from SQLite to PostgreSQL")
+    command.add_argument('--dsn', help="PostgreSQL connection string (default: POSTGRES_DSN)")
+    command.add_argument('--chunk-size', type=int, default=MIGRATION_CHUNK_SIZE, help="rows copied per transaction")
+    command.add_argument('--restart', action='store_true', help="copy every table from the start instead of resuming")
+    command.set_defaults(handler=_migrate)
+    return parser
+
+# Write the process metrics atomically, so a collector never reads a partial file
+def _write_metrics(path):
+    import os
+    from metrics import prometheus_text
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(temp_path, path)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        ok = args.handler(args)
+    finally:
+        if args.metrics_file:
+            _write_metrics(args.metrics_file)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -44,4 +44,90 @@ DEFAULT_TAGS = {
 
 # Determine the absolute path to reviews.db
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DB_PATH = os.path.join(BASE_DIR, 'reviews.db')
+DB_PATH = os.environ.get('REVIEWS_DB_PATH', os.path.join(BASE_DIR, 'reviews.db'))
+
+# Directory for the per-app columnar (Arrow IPC) review snapshots behind db.get_reviews, written on demand
+# with db.write_review_snapshot (only benchmark.py and scripts use them; no dashboard page loads whole apps)
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(BASE_DIR, 'snapshots'))
+
+# Hold review_id, username and review_text of review DataFrames as pyarrow-backed strings
+REVIEW_FRAME_PYARROW_STRINGS = os.environ.get('REVIEW_FRAME_PYARROW_STRINGS', '1') == '1'
+
+# Bounds of the get_reviews cache, which is keyed on (app_id, date range, data version)
+REVIEWS_CACHE_MAX_ENTRIES = int(os.environ.get('REVIEWS_CACHE_MAX_ENTRIES', 32))
+REVIEWS_CACHE_TTL_SECONDS = int(os.environ.get('REVIEWS_CACHE_TTL_SECONDS', 3600))
+
+# Match tag rule keywords only as whole words (e.g. 'add' no longer matches 'address')
+TAG_RULE_WORD_BOUNDARIES = os.environ.get('TAG_RULE_WORD_BOUNDARIES', '0') == '1'
+
+# spaCy model used for tag extraction, loaded on first use without the components it doesn't need
+SPACY_MODEL = os.environ.get('SPACY_MODEL', 'en_core_web_sm')
+SPACY_EXCLUDED_COMPONENTS = ['lemmatizer']
+
+# spaCy batch extraction settings (n_process=-1 uses all CPU cores)
+SPACY_BATCH_SIZE = int(os.environ.get('SPACY_BATCH_SIZE', 256))
+SPACY_N_PROCESS = int(os.environ.get('SPACY_N_PROCESS', 1))
+
+# Play Store fetch rate limiting: adaptive token bucket (requests/sec) and retry backoff (seconds)
+FETCH_RATE_INITIAL = 1.0
+FETCH_RATE_MIN = 0.1
+FETCH_RATE_MAX = 5.0
+FETCH_BURST = 3
+FETCH_RATE_INCREASE = 0.1
+FETCH_RATE_DECREASE = 0.5
+FETCH_BACKOFF_BASE = 2.0
+FETCH_BACKOFF_CAP = 120.0
+FETCH_MAX_RETRIES = 5
+
+# Checkpoints of interrupted refreshes older than this are discarded instead of resumed,
+# since the Play Store continuation token may have expired
+FETCH_CHECKPOINT_MAX_AGE_HOURS = 24
+
+# Streaming refresh pipeline: reviews analyzed and saved per batch, and batches buffered between stages
+PIPELINE_BATCH_SIZE = 500
+PIPELINE_QUEUE_SIZE = 4
+
+# Scheduled refresh settings (see scheduler.py)
+REFRESH_INTERVAL_MINUTES = int(os.environ.get('REFRESH_INTERVAL_MINUTES', 60))
+REFRESH_MAX_WORKERS = int(os.environ.get('REFRESH_MAX_WORKERS', 4))
+REFRESH_EXECUTOR = os.environ.get('REFRESH_EXECUTOR', 'thread')  # 'thread' or 'process'
+REFRESH_MAX_JOBS_PER_APP = 1
+REFRESH_MAX_JOBS_TOTAL = int(os.environ.get('REFRESH_MAX_JOBS_TOTAL', REFRESH_MAX_WORKERS))
+# A running job renews its lease (heartbeat_at) with every saved batch; a job that has not renewed it
+# for this long is treated as crashed and marked abandoned, so it no longer blocks refreshes of its app
+REFRESH_JOB_LEASE_MINUTES = int(os.environ.get('REFRESH_JOB_LEASE_MINUTES', 15))
+
+# Number of reviews written per transaction by auto-tagging
+TAG_WRITE_CHUNK_SIZE = 5000
+
+# Persistent cache of sentiment and extracted tags per review text. Bump ANALYSIS_CACHE_VERSION
+# whenever the analysis logic changes so stale results are not reused.
+ANALYSIS_CACHE_VERSION = 2
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 1000000))
+
+# Number of most recent runs per pipeline stage used for the p50/p95 timings in metrics.py
+METRICS_WINDOW_SIZE = int(os.environ.get('METRICS_WINDOW_SIZE', 1000))
+
+# Database behind db.py: 'sqlite' (the DB_PATH file) or 'postgresql' (POSTGRES_DSN), see storage.py
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+
+# PostgreSQL connection as a libpq DSN (PG* environment variables fill in anything it leaves out)
+POSTGRES_DSN = os.environ.get('POSTGRES_DSN', 'dbname=reviews user=saodatJustdice host=localhost port=5432')
+
+# PostgreSQL connections kept open by db.py, and rows sent per round trip by bulk writes
+POSTGRES_POOL_SIZE = int(os.environ.get('POSTGRES_POOL_SIZE', 8))
+POSTGRES_BATCH_SIZE = int(os.environ.get('POSTGRES_BATCH_SIZE', 1000))
+
+# Rows copied per transaction by the SQLite to PostgreSQL migration (see migrate.py)
+MIGRATION_CHUNK_SIZE = int(os.environ.get('MIGRATION_CHUNK_SIZE', 50000))
+
+# SQLite connection pool settings and per-connection pragmas
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 8))
+SQLITE_BUSY_TIMEOUT = 30
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # negative values are KiB, i.e. ~64 MB
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
@@ -1,85 +1,117 @@
-import sqlite3
+import json
 import pandas as pd
 import logging
-import streamlit as st
-from config import DB_PATH, DEFAULT_TAGS
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from config import DEFAULT_TAGS, REVIEW_FRAME_PYARROW_STRINGS, REVIEWS_CACHE_MAX_ENTRIES, REVIEWS_CACHE_TTL_SECONDS
+from metrics import span, observe, increment
+from storage import create_backend
 import time
+from datetime import datetime, timedelta, timezone
 
 # Global flag to ensure init_db is called only once
 _DB_INITIALIZED = False
+_DB_INIT_LOCK = threading.Lock()
+
+# Thread-safe pool of connections opened by the storage backend (see storage.py).
+# Connections run in autocommit mode; writes are grouped with transaction().
+class ConnectionPool:
+    def __init__(self, backend, max_size=None):
+        self.backend = backend
+        self.max_size = max_size or backend.pool_size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.backend.connect()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.max_size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_BACKEND = create_backend()
+_POOL = ConnectionPool(_BACKEND)
+_LOCAL = threading.local()
+
+# Borrow a pooled connection; nested calls in the same thread reuse the same connection
+@contextmanager
+def get_connection():
+    conn = getattr(_LOCAL, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+    if not _DB_INITIALIZED:
+        init_db()
+    conn = _POOL.acquire()
+    _LOCAL.conn = conn
+    try:
+        yield conn
+    finally:
+        _LOCAL.conn = None
+        _POOL.release(conn)
+
+# Run the enclosed statements in one write transaction (a savepoint when nested)
+@contextmanager
+def transaction():
+    with get_connection() as conn:
+        if conn.in_transaction:
+            conn.execute("SAVEPOINT nested_transaction")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK TO nested_transaction")
+                conn.execute("RELEASE nested_transaction")
+                raise
+            conn.execute("RELEASE nested_transaction")
+            return
+        # Time spent starting the transaction (waiting for SQLite's write lock while other writers
+        # hold it) is recorded as db_lock_wait
+        start_time = time.perf_counter()
+        conn.execute(_BACKEND.begin_write)
+        observe('db_lock_wait', time.perf_counter() - start_time)
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
 
 # Initialize database tables
 def init_db():
-    global _DB_INITIALIZED
     if _DB_INITIALIZED:
         logging.info("Database already initialized, skipping init_db.")
         return
+    with _DB_INIT_LOCK:
+        if _DB_INITIALIZED:
+            return
+        _init_schema()
+
+# Create tables, run schema migrations and seed default data
+def _init_schema():
+    global _DB_INITIALIZED
+    conn = None
     try:
-        clear_reviews_cache()
         start_time = time.time()
-        conn = sqlite3.connect(DB_PATH)
+        conn = _POOL.acquire()
+        conn.execute(_BACKEND.begin_write)
         cursor = conn.cursor()
 
-        # Reviews table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reviews (
-                app_id TEXT,
-                review_id TEXT PRIMARY KEY,
-                username TEXT,
-                date TEXT,
-                rating INTEGER,
-                review_text TEXT,
-                sentiment TEXT,
-                sentiment_score FLOAT,
-                tags TEXT
-            )
-        ''')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_app_id ON reviews (app_id)')
-
-        # App IDs table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS app_ids (
-                app_id TEXT PRIMARY KEY
-            )
-        ''')
-
-        # Tag rules table
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='tag_rules'")
-        if cursor.fetchone():
-            cursor.execute("PRAGMA table_info(tag_rules)")
-            columns = [info[1] for info in cursor.fetchall()]
-            if 'app_id' not in columns:
-                logging.info("Migrating tag_rules table to include app_id column.")
-                cursor.execute("ALTER TABLE tag_rules RENAME TO tag_rules_old")
-                cursor.execute('''
-                    CREATE TABLE tag_rules (
-                        app_id TEXT,
-                        tag_name TEXT,
-                        keywords TEXT,
-                        PRIMARY KEY (app_id, tag_name)
-                    )
-                ''')
-                cursor.execute("INSERT INTO tag_rules (app_id, tag_name, keywords) SELECT 'cashgiraffe.app', tag_name, keywords FROM tag_rules_old")
-                cursor.execute("DROP TABLE tag_rules_old")
-                logging.info("tag_rules table migration completed.")
-        else:
-            cursor.execute('''
-                CREATE TABLE tag_rules (
-                    app_id TEXT,
-                    tag_name TEXT,
-                    keywords TEXT,
-                    PRIMARY KEY (app_id, tag_name)
-                )
-            ''')
-
-        # Extracted tags table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS extracted_tags (
-                app_id TEXT,
-                tag_name TEXT,
-                PRIMARY KEY (app_id, tag_name)
-            )
-        ''')
+        _BACKEND.create_schema(cursor)
 
         # Populate app_ids with initial values if empty
         cursor.execute("SELECT COUNT(*) FROM app_ids")
@@ -98,24 +130,28 @@ def init_db():
                     cursor.execute("INSERT INTO tag_rules (app_id, tag_name, keywords) VALUES (?, ?, ?)",
                                    (app_id, tag_name, ','.join(keywords)))
 
-        conn.commit()
-        conn.close()
+        conn.execute("COMMIT")
         _DB_INITIALIZED = True
-        logging.info(f"Database initialized successfully at {DB_PATH}.")
+        logging.info(f"Database initialized successfully at {_BACKEND.location}.")
         logging.info(f"init_db took {time.time() - start_time:.2f} seconds")
     except Exception as e:
         logging.error(f"Error initializing database: {e}")
         raise
+    finally:
+        if conn is not None:
+            _POOL.release(conn)
+
+# Current UTC time, optionally shifted by hours, in the format of stored timestamps
+def _utc_now(hours=0):
+    return (datetime.now(timezone.utc) + timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
 
 # Fetch all app IDs from the database
 def get_app_ids():
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT app_id FROM app_ids")
-        app_ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT app_id FROM app_ids")
+            app_ids = [row[0] for row in cursor.fetchall()]
         return sorted(app_ids)
     except Exception as e:
         logging.error(f"Error fetching app IDs: {e}")
@@ -124,17 +160,13 @@ def get_app_ids():
 # Add a new app ID to the database
 def add_app_id(new_app_id):
     try:
-        init_db()
         new_app_id = new_app_id.strip()
         if not new_app_id or ' ' in new_app_id:
             raise ValueError("App ID must be non-empty and contain no spaces.")
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO app_ids (app_id) VALUES (?)", (new_app_id,))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO app_ids (app_id) VALUES (?) ON CONFLICT DO NOTHING", (new_app_id,))
         logging.info(f"Added new app ID: {new_app_id}")
-        get_reviews.clear()
     except Exception as e:
         logging.error(f"Error adding app ID {new_app_id}: {e}")
         raise
@@ -142,28 +174,37 @@ def add_app_id(new_app_id):
 # Load tag rules from the database for a specific app
 def load_tag_rules(app_id='cashgiraffe.app'):
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT tag_name, keywords FROM tag_rules WHERE app_id = ?", (app_id,))
-        tag_rules = {}
-        for tag_name, keywords in cursor.fetchall():
-            tag_rules[tag_name] = keywords.split(',')
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT tag_name, keywords FROM tag_rules WHERE app_id = ?", (app_id,))
+            tag_rules = {}
+            for tag_name, keywords in cursor.fetchall():
+                tag_rules[tag_name] = keywords.split(',')
         return tag_rules
     except Exception as e:
         logging.error(f"Error loading tag rules for {app_id}: {e}")
         return {}
 
+# Current version of an app's tag rules (bumped by triggers on every rule change, so other processes
+# see changes too), or None when it can't be read
+def get_tag_rules_version(app_id):
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT version FROM tag_rule_versions WHERE app_id = ?", (app_id,))
+            row = cursor.fetchone()
+        return row[0] if row else 0
+    except Exception as e:
+        logging.error(f"Error loading tag rules version for {app_id}: {e}")
+        return None
+
 # Load extracted tags from the database for a specific app
 def load_extracted_tags(app_id='cashgiraffe.app'):
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT tag_name FROM extracted_tags WHERE app_id = ?", (app_id,))
-        extracted_tags = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT tag_name FROM extracted_tags WHERE app_id = ?", (app_id,))
+            extracted_tags = [row[0] for row in cursor.fetchall()]
         return extracted_tags
     except Exception as e:
         logging.error(f"Error loading extracted tags for {app_id}: {e}")
@@ -172,13 +213,11 @@ def load_extracted_tags(app_id='cashgiraffe.app'):
 # Add a new tag rule
 def add_tag_rule(app_id, tag_name, keywords):
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR REPLACE INTO tag_rules (app_id, tag_name, keywords) VALUES (?, ?, ?)",
-                       (app_id, tag_name, ','.join(keywords)))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO tag_rules (app_id, tag_name, keywords) VALUES (?, ?, ?) "
+                           "ON CONFLICT (app_id, tag_name) DO UPDATE SET keywords = excluded.keywords",
+                           (app_id, tag_name, ','.join(keywords)))
         logging.info(f"Added tag rule for {app_id}: {tag_name} with keywords {keywords}")
     except Exception as e:
         logging.error(f"Error adding tag rule: {e}")
@@ -187,37 +226,37 @@ def add_tag_rule(app_id, tag_name, keywords):
 # Add an extracted tag
 def add_extracted_tag(app_id, tag_name):
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR IGNORE INTO extracted_tags (app_id, tag_name) VALUES (?, ?)",
-                       (app_id, tag_name))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO extracted_tags (app_id, tag_name) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                           (app_id, tag_name))
         logging.info(f"Added extracted tag for {app_id}: {tag_name}")
     except Exception as e:
         logging.error(f"Error adding extracted tag: {e}")
         raise
 
-# Delete a tag rule and remove the tag from reviews
-def delete_tag_rule(app_id, tag_name):
+# Add many extracted tags in one transaction
+def add_extracted_tags(app_id, tag_names):
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT review_id, tags FROM reviews WHERE app_id = ? AND tags LIKE ?",
-                       (app_id, f'%{tag_name}%'))
-        for review_id, tags in cursor.fetchall():
-            if tags:
-                tag_list = tags.split(',')
-                if tag_name in tag_list:
-                    tag_list.remove(tag_name)
-                    new_tags = ','.join(tag_list) if tag_list else None
-                    cursor.execute("UPDATE reviews SET tags = ? WHERE review_id = ?",
-                                   (new_tags, review_id))
-        cursor.execute("DELETE FROM tag_rules WHERE app_id = ? AND tag_name = ?", (app_id, tag_name))
-        conn.commit()
-        conn.close()
+        tag_names = sorted(set(tag_names))
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT INTO extracted_tags (app_id, tag_name) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                               [(app_id, tag_name) for tag_name in tag_names])
+        logging.info(f"Added {len(tag_names)} extracted tags for {app_id}")
+    except Exception as e:
+        logging.error(f"Error adding extracted tags: {e}")
+        raise
+
+# Delete a tag rule and remove the tag from reviews (unless remove_from_reviews is False, when the
+# caller re-tags the affected reviews itself)
+def delete_tag_rule(app_id, tag_name, remove_from_reviews=True):
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            if remove_from_reviews:
+                cursor.execute("DELETE FROM review_tags WHERE app_id = ? AND tag = ?", (app_id, tag_name))
+            cursor.execute("DELETE FROM tag_rules WHERE app_id = ? AND tag_name = ?", (app_id, tag_name))
         logging.info(f"Deleted tag rule for {app_id}: {tag_name}")
     except Exception as e:
         logging.error(f"Error deleting tag rule: {e}")
@@ -226,43 +265,807 @@ def delete_tag_rule(app_id, tag_name):
 # Delete an extracted tag and remove it from reviews
 def delete_extracted_tag(app_id, tag_name):
     try:
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT review_id, tags FROM reviews WHERE app_id = ? AND tags LIKE ?",
-                       (app_id, f'%{tag_name}%'))
-        for review_id, tags in cursor.fetchall():
-            if tags:
-                tag_list = tags.split(',')
-                if tag_name in tag_list:
-                    tag_list.remove(tag_name)
-                    new_tags = ','.join(tag_list) if tag_list else None
-                    cursor.execute("UPDATE reviews SET tags = ? WHERE review_id = ?",
-                                   (new_tags, review_id))
-        cursor.execute("DELETE FROM extracted_tags WHERE app_id = ? AND tag_name = ?", (app_id, tag_name))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM review_tags WHERE app_id = ? AND tag = ?", (app_id, tag_name))
+            cursor.execute("DELETE FROM extracted_tags WHERE app_id = ? AND tag_name = ?", (app_id, tag_name))
         logging.info(f"Deleted extracted tag for {app_id}: {tag_name}")
     except Exception as e:
         logging.error(f"Error deleting extracted tag: {e}")
         raise
 
-# Database connection (cached)
-@st.cache_data
+# Load (review_id, review_text) pairs of an app's reviews, or of the given review IDs only
+def load_review_texts(app_id, review_ids=None, chunk_size=500):
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            if review_ids is None:
+                cursor.execute("SELECT review_id, review_text FROM reviews WHERE app_id = ?", (app_id,))
+                return cursor.fetchall()
+            review_ids = sorted(review_ids)
+            texts = []
+            for start in range(0, len(review_ids), chunk_size):
+                chunk = review_ids[start:start + chunk_size]
+                cursor.execute(f"SELECT review_id, review_text FROM reviews WHERE app_id = ? "
+                               f"AND review_id IN ({','.join('?' * len(chunk))})", [app_id] + chunk)
+                texts.extend(cursor.fetchall())
+            return texts
+    except Exception as e:
+        logging.error(f"Error loading review texts for {app_id}: {e}")
+        raise
+
+# Get the newest review seen for an app, falling back to the newest stored review
+def get_fetch_state(app_id):
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT last_review_id, last_review_at FROM fetch_state WHERE app_id = ?", (app_id,))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("SELECT review_id, date FROM reviews WHERE app_id = ? ORDER BY date DESC LIMIT 1",
+                               (app_id,))
+                row = cursor.fetchone()
+        return row if row else (None, None)
+    except Exception as e:
+        logging.error(f"Error loading fetch state for {app_id}: {e}")
+        return None, None
+
+# Record the newest review seen for an app
+def save_fetch_state(app_id, last_review_id, last_review_at):
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO fetch_state (app_id, last_review_id, last_review_at) VALUES (?, ?, ?) "
+                           "ON CONFLICT (app_id) DO UPDATE SET last_review_id = excluded.last_review_id, "
+                           "last_review_at = excluded.last_review_at",
+                           (app_id, last_review_id, last_review_at))
+        logging.info(f"Saved fetch state for {app_id}: {last_review_id} at {last_review_at}")
+    except Exception as e:
+        logging.error(f"Error saving fetch state: {e}")
+        raise
+
+# Load the checkpoint of an interrupted refresh ('full' or 'incremental' mode) as a dict,
+# or None if there is no recent one
+def get_fetch_checkpoint(app_id, mode, max_age_hours=24):
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT mode, continuation_token, pages, reviews, newest_review_id, newest_review_at, "
+                           "stop_at_review_id, stop_at_date, updated_at FROM fetch_checkpoints "
+                           "WHERE app_id = ? AND mode = ? AND updated_at >= ?",
+                           (app_id, mode, _utc_now(-max_age_hours)))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+    except Exception as e:
+        logging.error(f"Error loading fetch checkpoint for {app_id}: {e}")
+        return None
+
+# Record how far a refresh got; call in the same transaction as the batch write it covers
+def save_fetch_checkpoint(app_id, mode, continuation_token, pages, reviews, newest_review_id=None,
+                          newest_review_at=None, stop_at_review_id=None, stop_at_date=None):
+    try:
+        with transaction() as conn:
+            conn.execute('''
+                INSERT INTO fetch_checkpoints (app_id, mode, continuation_token, pages, reviews,
+                    newest_review_id, newest_review_at, stop_at_review_id, stop_at_date, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (app_id, mode) DO UPDATE SET
+                    continuation_token = excluded.continuation_token,
+                    pages = excluded.pages,
+                    reviews = excluded.reviews,
+                    newest_review_id = excluded.newest_review_id,
+                    newest_review_at = excluded.newest_review_at,
+                    stop_at_review_id = excluded.stop_at_review_id,
+                    stop_at_date = excluded.stop_at_date,
+                    updated_at = excluded.updated_at
+            ''', (app_id, mode, continuation_token, pages, reviews, newest_review_id, newest_review_at,
+                  stop_at_review_id, stop_at_date, _utc_now()))
+    except Exception as e:
+        logging.error(f"Error saving fetch checkpoint for {app_id}: {e}")
+        raise
+
+# Forget the checkpoint of an app's refresh once it has completed (or can't be resumed)
+def clear_fetch_checkpoint(app_id, mode):
+    try:
+        with transaction() as conn:
+            conn.execute("DELETE FROM fetch_checkpoints WHERE app_id = ? AND mode = ?", (app_id, mode))
+    except Exception as e:
+        logging.error(f"Error clearing fetch checkpoint for {app_id}: {e}")
+        raise
+
+# Start a refresh job unless the per-app or global limit of running jobs is reached. Running jobs whose
+# lease was not renewed for lease_minutes are marked abandoned first.
+# Returns the new job_id, or None when the job has to be skipped.
+def start_refresh_job(app_id, trigger='manual', max_per_app=1, max_total=None, lease_minutes=15):
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            _BACKEND.lock_refresh_jobs(cursor)
+            cursor.execute("UPDATE refresh_jobs SET status = 'abandoned', finished_at = ?, "
+                           "message = 'No heartbeat since ' || COALESCE(heartbeat_at, started_at) "
+                           "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?",
+                           (_utc_now(), _utc_now(-lease_minutes / 60)))
+            if cursor.rowcount:
+                logging.warning(f"Marked {cursor.rowcount} refresh jobs without a heartbeat for "
+                                f"{lease_minutes} minutes as abandoned")
+            cursor.execute("SELECT COUNT(*), SUM(CASE WHEN app_id = ? THEN 1 ELSE 0 END) FROM refresh_jobs "
+                           "WHERE status = 'running'", (app_id,))
+            running_total, running_for_app = cursor.fetchone()
+            if (running_for_app or 0) >= max_per_app or (max_total and running_total >= max_total):
+                logging.info(f"Skipping refresh of {app_id}: {running_for_app or 0} running for the app, "
+                             f"{running_total} running in total")
+                return None
+            now = _utc_now()
+            return _BACKEND.insert_returning_id(cursor, "INSERT INTO refresh_jobs (app_id, trigger, status, started_at, "
+                                                        "heartbeat_at) VALUES (?, ?, 'running', ?, ?)",
+                                                (app_id, trigger, now, now), 'job_id')
+    except Exception as e:
+        logging.error(f"Error starting refresh job for {app_id}: {e}")
+        raise
+
+# Renew the lease of a running refresh job
+def renew_refresh_job(job_id):
+    try:
+        with transaction() as conn:
+            conn.execute("UPDATE refresh_jobs SET heartbeat_at = ? WHERE job_id = ? AND status = 'running'",
+                         (_utc_now(), job_id))
+    except Exception as e:
+        logging.error(f"Error renewing refresh job {job_id}: {e}")
+        raise
+
+# Running refresh jobs whose lease was not renewed for lease_minutes (their process most likely died)
+def get_stale_refresh_jobs(lease_minutes=15):
+    try:
+        with get_connection() as conn:
+            return pd.read_sql_query("SELECT * FROM refresh_jobs WHERE status = 'running' "
+                                     "AND COALESCE(heartbeat_at, started_at) < ? ORDER BY job_id",
+                                     conn, params=[_utc_now(-lease_minutes / 60)])
+    except Exception as e:
+        logging.error(f"Error loading stale refresh jobs: {e}")
+        return pd.DataFrame()
+
+# Record the outcome of a refresh job
+def finish_refresh_job(job_id, status, fetched=0, saved=0, message=None):
+    try:
+        with transaction() as conn:
+            conn.execute("UPDATE refresh_jobs SET status = ?, finished_at = ?, fetched = ?, "
+                         "saved = ?, message = ? WHERE job_id = ?", (status, _utc_now(), fetched, saved, message, job_id))
+    except Exception as e:
+        logging.error(f"Error finishing refresh job {job_id}: {e}")
+        raise
+
+# Load the most recent refresh jobs, optionally for one app
+def get_refresh_jobs(app_id=None, limit=50):
+    try:
+        with get_connection() as conn:
+            query = "SELECT * FROM refresh_jobs"
+            params = []
+            if app_id:
+                query += " WHERE app_id = ?"
+                params.append(app_id)
+            query += " ORDER BY job_id DESC LIMIT ?"
+            params.append(limit)
+            return pd.read_sql_query(query, conn, params=params)
+    except Exception as e:
+        logging.error(f"Error loading refresh jobs: {e}")
+        return pd.DataFrame()
+
+# Look up cached analysis results; returns {text_hash: (sentiment, sentiment_score, tags)} for the hits
+# and the hits not yet marked as used today, which the caller passes on to save_cached_analyses
+def get_cached_analyses(text_hashes, chunk_size=500):
+    try:
+        text_hashes = list(text_hashes)
+        today = time.strftime('%Y-%m-%d')
+        cached, stale = {}, []
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(text_hashes), chunk_size):
+                chunk = text_hashes[start:start + chunk_size]
+                cursor.execute(f"SELECT text_hash, sentiment, sentiment_score, tags, last_used FROM analysis_cache "
+                               f"WHERE text_hash IN ({','.join('?' * len(chunk))})", chunk)
+                for text_hash, sentiment, sentiment_score, tags, last_used in cursor.fetchall():
+                    cached[text_hash] = (sentiment, sentiment_score, json.loads(tags))
+                    if not last_used or last_used < today:
+                        stale.append(text_hash)
+        return cached, stale
+    except Exception as e:
+        logging.error(f"Error loading cached analyses: {e}")
+        return {}, []
+
+# Store (text_hash, sentiment, sentiment_score, tags) analysis results and mark the used cache hits as
+# used today, in one transaction, so eviction drops the least recently used entries first
+def save_cached_analyses(entries, used=(), chunk_size=500):
+    try:
+        today = time.strftime('%Y-%m-%d')
+        # One row per text hash: an upsert can't change the same row twice in PostgreSQL
+        rows = {text_hash: (text_hash, sentiment, float(score), json.dumps(list(tags)), today)
+                for text_hash, sentiment, score, tags in entries}
+        used = list(used)
+        if not rows and not used:
+            return
+        with transaction() as conn:
+            for start in range(0, len(used), chunk_size):
+                chunk = used[start:start + chunk_size]
+                conn.execute(f"UPDATE analysis_cache SET last_used = ? WHERE text_hash IN ({','.join('?' * len(chunk))})",
+                             [today] + chunk)
+            if rows:
+                conn.executemany('''
+                    INSERT INTO analysis_cache (text_hash, sentiment, sentiment_score, tags, last_used)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (text_hash) DO UPDATE SET
+                        sentiment = excluded.sentiment,
+                        sentiment_score = excluded.sentiment_score,
+                        tags = excluded.tags,
+                        last_used = excluded.last_used
+                ''', list(rows.values()))
+    except Exception as e:
+        logging.error(f"Error saving cached analyses: {e}")
+        raise
+
+# Keep the analysis cache within max_entries by evicting the least recently used entries
+def evict_analysis_cache(max_entries):
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM analysis_cache")
+            excess = cursor.fetchone()[0] - max_entries
+            if excess <= 0:
+                return 0
+            cursor.execute("DELETE FROM analysis_cache WHERE text_hash IN "
+                           "(SELECT text_hash FROM analysis_cache ORDER BY last_used LIMIT ?)", (excess,))
+        logging.info(f"Evicted {excess} entries from the analysis cache")
+        return excess
+    except Exception as e:
+        logging.error(f"Error evicting analysis cache entries: {e}")
+        raise
+
+# Columns stored in the reviews table by the refresh write path
+REVIEW_COLUMNS = ['app_id', 'review_id', 'username', 'date', 'rating', 'review_text', 'sentiment', 'sentiment_score']
+
+# Split a comma-separated tag string (or an iterable of tags) into a list of tags
+def _split_tags(tags):
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        return [tag.strip() for tag in tags.split(',') if tag.strip()]
+    return list(tags)
+
+# Load the stored tags of the given reviews, keyed by review_id
+def _load_review_tags(cursor, review_ids, chunk_size=500):
+    stored = {}
+    for start in range(0, len(review_ids), chunk_size):
+        chunk = review_ids[start:start + chunk_size]
+        cursor.execute(f"SELECT review_id, tag FROM review_tags WHERE review_id IN ({','.join('?' * len(chunk))})",
+                       chunk)
+        for review_id, tag in cursor.fetchall():
+            stored.setdefault(review_id, set()).add(tag)
+    return stored
+
+# Replace the tags of the given (review_id, tags) pairs using an open cursor. Only the tags that
+# changed are deleted or inserted, so reviews whose tags stay the same cost no writes (and no
+# rollup or data version trigger runs). Returns the number of reviews whose tags changed.
+def _replace_review_tags(cursor, app_id, review_tags):
+    review_tags = {review_id: set(_split_tags(tags)) for review_id, tags in review_tags}
+    stored = _load_review_tags(cursor, list(review_tags))
+    removed, added, changed = [], [], 0
+    for review_id, tags in review_tags.items():
+        stored_tags = stored.get(review_id, set())
+        removed.extend((review_id, tag) for tag in stored_tags - tags)
+        added.extend((app_id, review_id, tag) for tag in tags - stored_tags)
+        changed += tags != stored_tags
+    cursor.executemany("DELETE FROM review_tags WHERE review_id = ? AND tag = ?", removed)
+    cursor.executemany("INSERT INTO review_tags (app_id, review_id, tag) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                       added)
+    return changed
+
+# Load (username, date, rating, review_text) of already stored reviews, keyed by review_id
+def _load_stored_reviews(cursor, review_ids, chunk_size=500):
+    stored = {}
+    for start in range(0, len(review_ids), chunk_size):
+        chunk = review_ids[start:start + chunk_size]
+        cursor.execute(f"SELECT review_id, username, date, rating, review_text FROM reviews "
+                       f"WHERE review_id IN ({','.join('?' * len(chunk))})", chunk)
+        for review_id, *values in cursor.fetchall():
+            stored[review_id] = tuple(values)
+    return stored
+
+# Replace the tags of the given (review_id, tags) pairs; tags may be a list or a comma-separated string.
+# Returns the number of reviews whose tags changed.
+def set_review_tags(app_id, review_tags):
+    try:
+        with span('db_write_tags', items=len(review_tags)), transaction() as conn:
+            cursor = conn.cursor()
+            return _replace_review_tags(cursor, app_id, review_tags)
+    except Exception as e:
+        logging.error(f"Error saving review tags for {app_id}: {e}")
+        raise
+
+# Add or remove one tag on the given (review_id, has_tag) pairs, leaving their other tags alone.
+# Returns the number of reviews whose tags changed.
+def set_review_tag(app_id, tag, review_tags, chunk_size=500):
+    try:
+        wanted = {review_id for review_id, has_tag in review_tags if has_tag}
+        review_ids = [review_id for review_id, _ in review_tags]
+        with span('db_write_tags', items=len(review_ids)), transaction() as conn:
+            cursor = conn.cursor()
+            tagged = set()
+            for start in range(0, len(review_ids), chunk_size):
+                chunk = review_ids[start:start + chunk_size]
+                cursor.execute(f"SELECT review_id FROM review_tags WHERE tag = ? "
+                               f"AND review_id IN ({','.join('?' * len(chunk))})", [tag] + chunk)
+                tagged.update(row[0] for row in cursor.fetchall())
+            cursor.executemany("DELETE FROM review_tags WHERE review_id = ? AND tag = ?",
+                               [(review_id, tag) for review_id in tagged - wanted])
+            cursor.executemany("INSERT INTO review_tags (app_id, review_id, tag) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                               [(app_id, review_id, tag) for review_id in wanted - tagged])
+        return len(tagged ^ wanted)
+    except Exception as e:
+        logging.error(f"Error saving the {tag} tag for {app_id}: {e}")
+        raise
+
+# Start a full refresh of an app: forget which reviews the previous full refresh saw
+def begin_full_refresh(app_id):
+    try:
+        with transaction() as conn:
+            conn.execute("DELETE FROM refresh_seen WHERE app_id = ?", (app_id,))
+    except Exception as e:
+        logging.error(f"Error starting full refresh for {app_id}: {e}")
+        raise
+
+# Finish a full refresh: delete the app's reviews that were not seen during the refresh
+def prune_unseen_reviews(app_id):
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            unseen = ("SELECT review_id FROM reviews WHERE app_id = ? AND review_id NOT IN "
+                      "(SELECT review_id FROM refresh_seen WHERE app_id = ?)")
+            cursor.execute(f"DELETE FROM review_tags WHERE review_id IN ({unseen})", (app_id, app_id))
+            cursor.execute(f"DELETE FROM reviews WHERE review_id IN ({unseen})", (app_id, app_id))
+            pruned = cursor.rowcount
+            cursor.execute("DELETE FROM refresh_seen WHERE app_id = ?", (app_id,))
+        logging.info(f"Pruned {pruned} reviews of {app_id} that are no longer on the Play Store")
+        return pruned
+    except Exception as e:
+        logging.error(f"Error pruning reviews for {app_id}: {e}")
+        raise
+
+# Save a batch of analyzed reviews, upserting new/changed rows. Batches written as part of a
+# full refresh rewrite every row. All saved reviews are recorded as seen so prune_unseen_reviews
+# keeps them, even when an incremental refresh runs while a full refresh is being resumed.
+def save_reviews(app_id, reviews_df, full_refresh=False):
+    try:
+        reviews_df = reviews_df[REVIEW_COLUMNS + ['tags']].copy()
+        reviews_df['date'] = pd.to_datetime(reviews_df['date']).dt.strftime('%Y-%m-%d %H:%M:%S')
+        # Last row per review_id: an upsert can't change the same row twice in PostgreSQL
+        rows = list({row[1]: row for row in reviews_df.astype(object).where(reviews_df.notnull(), None)
+                     .itertuples(index=False, name=None)}.values())
+        with span('db_write_reviews') as write_span, transaction() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("INSERT INTO refresh_seen (app_id, review_id) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                               [(app_id, row[1]) for row in rows])
+            if not full_refresh:
+                stored = _load_stored_reviews(cursor, [row[1] for row in rows])
+                rows = [row for row in rows if stored.get(row[1]) != (row[2], row[3], row[4], row[5])]
+            cursor.executemany('''
+                INSERT INTO reviews (app_id, review_id, username, date, rating, review_text,
+                                     sentiment, sentiment_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (review_id) DO UPDATE SET
+                    app_id = excluded.app_id,
+                    username = excluded.username,
+                    date = excluded.date,
+                    rating = excluded.rating,
+                    review_text = excluded.review_text,
+                    sentiment = excluded.sentiment,
+                    sentiment_score = excluded.sentiment_score
+            ''', [row[:8] for row in rows])
+            _replace_review_tags(cursor, app_id, [(row[1], row[8]) for row in rows])
+            write_span['items'] = len(rows)
+        logging.info(f"Saved {len(rows)} new or changed reviews for {app_id} (full refresh: {full_refresh})")
+        return len(rows)
+    except Exception as e:
+        logging.error(f"Error saving reviews for {app_id}: {e}")
+        raise
+
+# Count reviews per tag for an app, most frequent first
+def get_tag_counts(app_id, limit=None):
+    try:
+        with get_connection() as conn:
+            query = ("SELECT tag, SUM(reviews) AS count FROM daily_tag_stats WHERE app_id = ? "
+                     "GROUP BY tag HAVING SUM(reviews) > 0 ORDER BY count DESC, tag")
+            params = [app_id]
+            if limit:
+                query += " LIMIT ?"
+                params.append(limit)
+            counts = pd.read_sql_query(query, conn, params=params)
+        return counts.set_index('tag')['count']
+    except Exception as e:
+        logging.error(f"Error counting tags for {app_id}: {e}")
+        return pd.Series(dtype='int64', name='count')
+
+# Daily review counts, rating sums and sentiment counts of an app, optionally within a date range
+# (columns: date, reviews, rating_sum, positive, negative, neutral)
+def get_daily_review_stats(app_id, start_date=None, end_date=None):
+    try:
+        with get_connection() as conn:
+            query = ("SELECT day AS date, reviews, rating_sum, positive, negative, neutral "
+                     "FROM daily_review_stats WHERE app_id = ?")
+            params = [app_id]
+            if start_date and end_date:
+                query += " AND day BETWEEN ? AND ?"
+                params.extend([start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')])
+            stats = pd.read_sql_query(query + " ORDER BY day", conn, params=params)
+        stats['date'] = pd.to_datetime(stats['date'])
+        return stats
+    except Exception as e:
+        logging.error(f"Error loading daily review stats for {app_id}: {e}")
+        return pd.DataFrame(columns=['date', 'reviews', 'rating_sum', 'positive', 'negative', 'neutral'])
+
+# Totals over all of an app's reviews: reviews, average_rating and Positive/Negative/Neutral counts
+def get_review_summary(app_id):
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT SUM(reviews), SUM(rating_sum), SUM(positive), SUM(negative), SUM(neutral) "
+                           "FROM daily_review_stats WHERE app_id = ?", (app_id,))
+            reviews, rating_sum, positive, negative, neutral = cursor.fetchone()
+        reviews = reviews or 0
+        return {
+            'reviews': reviews,
+            'average_rating': rating_sum / reviews if reviews else None,
+            'Positive': positive or 0,
+            'Negative': negative or 0,
+            'Neutral': neutral or 0,
+        }
+    except Exception as e:
+        logging.error(f"Error loading review summary for {app_id}: {e}")
+        return {'reviews': 0, 'average_rating': None, 'Positive': 0, 'Negative': 0, 'Neutral': 0}
+
+# List the distinct tags used on an app's reviews
+def get_app_tags(app_id):
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT tag FROM review_tags WHERE app_id = ? ORDER BY tag", (app_id,))
+            tags = [row[0] for row in cursor.fetchall()]
+        return tags
+    except Exception as e:
+        logging.error(f"Error loading tags for {app_id}: {e}")
+        return []
+
+# IDs of an app's reviews carrying any of the given tags
+def get_review_ids_with_tags(app_id, tags):
+    try:
+        tags = list(tags)
+        if not tags:
+            return set()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT DISTINCT review_id FROM review_tags WHERE app_id = ? AND tag IN ({','.join('?' * len(tags))})",
+                           [app_id] + tags)
+            review_ids = {row[0] for row in cursor.fetchall()}
+        return review_ids
+    except Exception as e:
+        logging.error(f"Error loading reviews with tags for {app_id}: {e}")
+        return set()
+
+# Escape the LIKE wildcards of a literal, with backslash as the escape character
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+# IDs of an app's reviews whose text may contain any of the keywords, ignoring case; callers confirm
+# each candidate with the tag matcher. With whole_words the search index is used where it can answer
+# (it matches a superset: word endings are ignored), otherwise the substring (trigram) index; keywords
+# neither index can answer are found with one scan of the texts in SQL.
+def find_reviews_with_keywords(app_id, keywords, whole_words=False):
+    try:
+        keywords = sorted({keyword.strip().lower() for keyword in keywords if keyword.strip()})
+        review_ids = set()
+        scanned = []
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            for keyword in keywords:
+                if whole_words:
+                    candidates = _BACKEND.find_keyword_candidates(cursor, app_id, keyword)
+                else:
+                    candidates = _BACKEND.find_substring_candidates(cursor, app_id, keyword)
+                if candidates is None:
+                    scanned.append(keyword)
+                else:
+                    review_ids.update(candidates)
+            if scanned:
+                matches = " OR ".join(f"{_BACKEND.lower('review_text')} LIKE ? ESCAPE '\\'" for _ in scanned)
+                cursor.execute(f"SELECT review_id FROM reviews WHERE app_id = ? AND ({matches})",
+                               [app_id] + [f"%{_escape_like(keyword)}%" for keyword in scanned])
+                review_ids.update(row[0] for row in cursor.fetchall())
+        return review_ids
+    except Exception as e:
+        logging.error(f"Error finding reviews with keywords for {app_id}: {e}")
+        raise
+
+# Daily review counts of the app's most frequent tags within a date range (columns: date, tags, count)
+def get_daily_tag_counts(app_id, start_date, end_date, top_n=5):
+    try:
+        with get_connection() as conn:
+            start, end = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+            counts = pd.read_sql_query('''
+                WITH tagged AS (
+                    SELECT day AS date, tag AS tags, reviews AS count
+                    FROM daily_tag_stats
+                    WHERE app_id = ? AND day BETWEEN ? AND ? AND reviews > 0
+                ),
+                top_tags AS (
+                    SELECT tags FROM tagged GROUP BY tags ORDER BY SUM(count) DESC, tags LIMIT ?
+                )
+                SELECT date, tags, count
+                FROM tagged WHERE tags IN (SELECT tags FROM top_tags)
+                ORDER BY date
+            ''', conn, params=[app_id, start, end, top_n])
+        counts['date'] = pd.to_datetime(counts['date'])
+        return counts
+    except Exception as e:
+        logging.error(f"Error loading daily tag counts for {app_id}: {e}")
+        return pd.DataFrame(columns=['date', 'tags', 'count'])
+
+# Oldest and newest review dates of an app as Timestamps, or (None, None) without reviews
+def get_review_date_range(app_id):
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(date), MAX(date) FROM reviews WHERE app_id = ?", (app_id,))
+            min_date, max_date = cursor.fetchone()
+        if min_date is None:
+            return None, None
+        return pd.Timestamp(min_date), pd.Timestamp(max_date)
+    except Exception as e:
+        logging.error(f"Error loading review date range for {app_id}: {e}")
+        return None, None
+
+# Build the WHERE clause and parameters for the review filters of the Reviews page
+def _review_filters(app_id, start_date=None, end_date=None, sentiments=None, rating_range=None, tags=None):
+    clauses = ["r.app_id = ?"]
+    params = [app_id]
+    if start_date:
+        clauses.append("r.date >= ?")
+        params.append(start_date.strftime('%Y-%m-%d'))
+    if end_date:
+        clauses.append("r.date < ?")
+        params.append((end_date + timedelta(days=1)).strftime('%Y-%m-%d'))
+    if sentiments is not None:
+        sentiments = list(sentiments)
+        clauses.append(f"r.sentiment IN ({','.join('?' * len(sentiments))})" if sentiments else "1 = 0")
+        params.extend(sentiments)
+    if rating_range:
+        clauses.append("r.rating BETWEEN ? AND ?")
+        params.extend(rating_range)
+    if tags:
+        tags = list(tags)
+        clauses.append(f"EXISTS (SELECT 1 FROM review_tags t WHERE t.review_id = r.review_id "
+                       f"AND t.tag IN ({','.join('?' * len(tags))}))")
+        params.extend(tags)
+    return " AND ".join(clauses), params
+
+# Load one page of an app's reviews matching the filters, newest first, plus the total number of
+# matching reviews. Pages are addressed by keyset: pass the (date, review_id) of the last review
+# of the previous page as after to get the next one (dates are returned as stored, for that reason).
+def get_reviews_page(app_id, start_date=None, end_date=None, sentiments=None, rating_range=None, tags=None,
+                     page_size=20, after=None):
+    try:
+        where, params = _review_filters(app_id, start_date, end_date, sentiments, rating_range, tags)
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM reviews r WHERE {where}", params)
+            total = cursor.fetchone()[0]
+            page_where, page_params = where, list(params)
+            if after is not None:
+                page_where += " AND (r.date, r.review_id) < (?, ?)"
+                page_params.extend(after)
+            page = pd.read_sql_query(f'''
+                SELECT r.app_id, r.review_id, r.username, r.date, r.rating, r.review_text,
+                       r.sentiment, r.sentiment_score,
+                       (SELECT {_BACKEND.group_concat('t.tag')} FROM review_tags t WHERE t.review_id = r.review_id) AS tags
+                FROM reviews r WHERE {page_where}
+                ORDER BY r.date DESC, r.review_id DESC LIMIT ?
+            ''', conn, params=page_params + [page_size])
+        return page, total
+    except Exception as e:
+        logging.error(f"Error loading reviews page for {app_id}: {e}")
+        return pd.DataFrame(columns=REVIEW_COLUMNS + ['tags']), 0
+
+# Full-text search over an app's reviews, best matches first, with the same optional filters as
+# get_reviews_page. Returns one page of matches (with a highlighted snippet and the backend's rank,
+# lower is better) and the total number of matches.
+def search_reviews(app_id, query, start_date=None, end_date=None, sentiments=None, rating_range=None, tags=None,
+                   limit=20, offset=0):
+    empty = pd.DataFrame(columns=REVIEW_COLUMNS + ['tags', 'snippet', 'rank'])
+    try:
+        search = _BACKEND.search_clauses(query)
+        if search is None:
+            return empty, 0
+        where, params = _review_filters(app_id, start_date, end_date, sentiments, rating_range, tags)
+        where = f"{search['match']} AND {where}"
+        params = [search['query']] + params
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM {search['from']} WHERE {where}", params)
+            total = cursor.fetchone()[0]
+            matches = pd.read_sql_query(f'''
+                SELECT r.app_id, r.review_id, r.username, r.date, r.rating, r.review_text,
+                       r.sentiment, r.sentiment_score,
+                       (SELECT {_BACKEND.group_concat('t.tag')} FROM review_tags t WHERE t.review_id = r.review_id) AS tags,
+                       {search['snippet']} AS snippet,
+                       {search['rank']} AS rank
+                FROM {search['from']}
+                WHERE {where}
+                ORDER BY rank LIMIT ? OFFSET ?
+            ''', conn, params=params + [limit, offset])
+        return matches, total
+    except Exception as e:
+        logging.error(f"Error searching reviews of {app_id} for {query!r}: {e}")
+        return empty, 0
+
+# Rebuild the search index from the reviews table (e.g. after a VACUUM renumbered rowids)
+def rebuild_search_index():
+    try:
+        with transaction() as conn:
+            _BACKEND.rebuild_search_index(conn)
+        logging.info("Rebuilt the review search index.")
+    except Exception as e:
+        logging.error(f"Error rebuilding the review search index: {e}")
+        raise
+
+# Current data version of an app (0 before its first write)
+def get_data_version(app_id):
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT version FROM data_versions WHERE app_id = ?", (app_id,))
+            row = cursor.fetchone()
+        return row[0] if row else 0
+    except Exception as e:
+        logging.error(f"Error loading data version for {app_id}: {e}")
+        return None
+
+# Select an app's reviews with their tags, optionally within a date range (end date inclusive)
+def _query_reviews(conn, app_id, start_date=None, end_date=None):
+    query = f'''
+        SELECT r.app_id, r.review_id, r.username, r.date, r.rating, r.review_text,
+               r.sentiment, r.sentiment_score,
+               (SELECT {_BACKEND.group_concat('t.tag')} FROM review_tags t WHERE t.review_id = r.review_id) AS tags
+        FROM reviews r WHERE r.app_id = ?
+    '''
+    params = [app_id]
+    if start_date and end_date:
+        query += " AND r.date >= ? AND r.date < ?"
+        params.extend([start_date.strftime('%Y-%m-%d'), (end_date + timedelta(days=1)).strftime('%Y-%m-%d')])
+    df = pd.read_sql_query(query, conn, params=params, parse_dates={'date': {'format': '%Y-%m-%d %H:%M:%S'}})
+    return _compact_reviews(df)
+
+# Sentiment labels, in display order
+SENTIMENT_DTYPE = pd.CategoricalDtype(['Positive', 'Negative', 'Neutral'])
+
+# Give a reviews DataFrame its compact schema: categorical app_id/sentiment/tags, int8 rating,
+# float32 score and (optionally) pyarrow-backed strings. SQLite's GROUP_CONCAT has no defined order,
+# so each tag string is sorted, making equal tag sets one category.
+def _compact_reviews(df):
+    df['app_id'] = df['app_id'].astype('category')
+    df['sentiment'] = df['sentiment'].astype(SENTIMENT_DTYPE)
+    tags = df['tags'].astype('category')
+    df['tags'] = tags.map({value: ','.join(sorted(value.split(','))) for value in tags.cat.categories}).astype('category')
+    df['rating'] = df['rating'].fillna(0).astype('int8')
+    df['sentiment_score'] = df['sentiment_score'].astype('float32')
+    if REVIEW_FRAME_PYARROW_STRINGS:
+        for column in ['review_id', 'username', 'review_text']:
+            df[column] = df[column].astype(pd.StringDtype('pyarrow'))
+    return df
+
+# Write the columnar snapshot of an app's reviews. Reviews and data version are read in one read
+# transaction, so the snapshot is never tagged with a version newer than its contents. Reading every
+# review is a full scan of the app, so nothing is written (returns None) while the existing snapshot
+# is still at the app's current data version. Refreshes and re-tagging don't write snapshots; scripts
+# and benchmark.py call this when they want one. snapshot (and with it pyarrow) is imported on first use.
+def write_review_snapshot(app_id):
+    try:
+        from snapshot import write_snapshot, snapshot_version
+        if snapshot_version(app_id) == get_data_version(app_id):
+            logging.info(f"Review snapshot for {app_id} is up to date")
+            return None
+        with get_connection() as conn:
+            own_transaction = not conn.in_transaction
+            if own_transaction:
+                conn.execute(_BACKEND.begin_read)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT version FROM data_versions WHERE app_id = ?", (app_id,))
+                row = cursor.fetchone()
+                reviews_df = _query_reviews(conn, app_id)
+            finally:
+                if own_transaction:
+                    conn.execute("COMMIT")
+        return write_snapshot(app_id, reviews_df, row[0] if row else 0)
+    except Exception as e:
+        logging.error(f"Error writing review snapshot for {app_id}: {e}")
+        return None
+
+# Process-wide LRU cache with a time-to-live, shared by all sessions and worker threads
+class TTLCache:
+    def __init__(self, max_entries, ttl_seconds, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self._clock() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# get_reviews results from the database, keyed on (app_id, date range, data version)
+_REVIEWS_CACHE = TTLCache(REVIEWS_CACHE_MAX_ENTRIES, REVIEWS_CACHE_TTL_SECONDS)
+
+# Load an app's reviews from its memory-mapped snapshot, falling back to the database when the snapshot is
+# missing or stale. Both are keyed on the app's data version, so cached results stay valid across
+# sessions until the app's reviews or tags actually change. The dashboard pages don't load whole apps
+# (they read the rollups and paged queries); get_reviews and the snapshot serve benchmark.py and
+# scripts working on a full app's reviews.
 def get_reviews(app_id='cashgiraffe.app', start_date=None, end_date=None):
+    with span('get_reviews') as reviews_span:
+        df, source = _load_reviews(app_id, start_date, end_date)
+        reviews_span['items'] = len(df)
+    increment('get_reviews', source=source)
+    return df
+
+# get_reviews without instrumentation; returns the reviews and where they came from
+def _load_reviews(app_id, start_date, end_date):
+    data_version = get_data_version(app_id)
+    try:
+        if data_version is not None:
+            from snapshot import read_snapshot
+            df = read_snapshot(app_id, data_version, start_date, end_date)
+            if df is not None:
+                df['sentiment'] = df['sentiment'].astype(SENTIMENT_DTYPE)
+                logging.info(f"Loaded {len(df)} reviews for app_id: {app_id} from snapshot")
+                return df, 'snapshot'
+    except Exception as e:
+        logging.error(f"Error reading review snapshot for {app_id}: {e}")
+    key = (app_id, start_date, end_date, data_version)
+    df = _REVIEWS_CACHE.get(key)
+    source = 'cache'
+    if df is None:
+        df = _get_reviews_from_db(app_id, start_date, end_date)
+        source = _BACKEND.name
+        if data_version is not None and not df.empty:
+            _REVIEWS_CACHE.put(key, df)
+    # Shallow copy, so callers adding or replacing columns don't change the cached frame
+    return df.copy(deep=False), source
+
+# Load an app's reviews from the database
+def _get_reviews_from_db(app_id='cashgiraffe.app', start_date=None, end_date=None):
     try:
-        init_db()
         logging.info(f"Fetching reviews for app_id: {app_id} with start_date: {start_date} and end_date: {end_date}")
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        query = "SELECT * FROM reviews WHERE app_id = ?"
-        params = [app_id]
-        if start_date and end_date:
-            query += " AND date BETWEEN ? AND ?"
-            params.extend([start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')])
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        df['date'] = pd.to_datetime(df['date'])
+        with get_connection() as conn:
+            df = _query_reviews(conn, app_id, start_date, end_date)
         if df.empty:
             logging.info(f"No reviews found for app_id: {app_id}")
         else:
@@ -272,6 +1075,6 @@ def get_reviews(app_id='cashgiraffe.app', start_date=None, end_date=None):
         logging.error(f"Error loading reviews from database: {e}")
         return pd.DataFrame()
 
-# Function to clear the cache for get_reviews
+# Drop every cached get_reviews result (not needed after writes: the data version changes instead)
 def clear_reviews_cache():
-    get_reviews.clear()
+    _REVIEWS_CACHE.clear()
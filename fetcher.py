@@ -1,63 +1,180 @@
-from google_play_scraper import reviews, Sort
+from google_play_scraper import Sort
+from google_play_scraper.constants.element import ElementSpecs
+from google_play_scraper.constants.request import Formats
+from google_play_scraper.features.reviews import _ContinuationToken, _fetch_review_items, MAX_COUNT_EACH_FETCH
+import json
 import logging
+import threading
 import time
+from config import (FETCH_RATE_INITIAL, FETCH_RATE_MIN, FETCH_RATE_MAX, FETCH_BURST, FETCH_RATE_INCREASE,
+                    FETCH_RATE_DECREASE, FETCH_BACKOFF_BASE, FETCH_BACKOFF_CAP, FETCH_MAX_RETRIES)
+from ratelimit import AdaptiveRateLimiter, backoff_delay
+from progress import ProgressEvent
+from metrics import observe, increment
 
-# Fetch reviews with pagination, with a callback for UI updates
-def fetch_all_reviews(app_id, batch_size=100, delay=10, max_retries=3, update_ui=None):
-    all_reviews = []
-    continuation_token = None
+# Process-wide rate limiter shared by all fetches
+_RATE_LIMITER = None
+_RATE_LIMITER_LOCK = threading.Lock()
+
+# Get the shared Play Store rate limiter, creating it on first use
+def get_rate_limiter():
+    global _RATE_LIMITER
+    with _RATE_LIMITER_LOCK:
+        if _RATE_LIMITER is None:
+            _RATE_LIMITER = AdaptiveRateLimiter(FETCH_RATE_INITIAL, FETCH_BURST, FETCH_RATE_MIN, FETCH_RATE_MAX,
+                                                FETCH_RATE_INCREASE, FETCH_RATE_DECREASE)
+        return _RATE_LIMITER
+
+# Fields of the scraper's continuation token, persisted so an interrupted fetch can be resumed
+_TOKEN_FIELDS = ['token', 'lang', 'country', 'sort', 'count', 'filter_score_with', 'filter_device_with']
+
+# Serialize a continuation token to JSON for a fetch checkpoint
+def dump_continuation_token(continuation_token):
+    if continuation_token is None:
+        return None
+    return json.dumps({field: getattr(continuation_token, field) for field in _TOKEN_FIELDS})
+
+# Rebuild a continuation token saved with dump_continuation_token
+def load_continuation_token(data):
+    if not data:
+        return None
+    fields = json.loads(data)
+    return _ContinuationToken(*[fields.get(field) for field in _TOKEN_FIELDS])
+
+# Fetch one page of reviews like google_play_scraper.reviews(), but let request errors escape: the
+# library catches them and returns an empty continuation token, which reads as the end of the list
+def fetch_reviews_page(app_id, lang='en', country='us', sort=Sort.NEWEST, count=100, filter_score_with=None,
+                       filter_device_with=None, continuation_token=None):
+    sort = getattr(sort, 'value', sort)
+    token = None
+    if continuation_token is not None:
+        if continuation_token.token is None:
+            return [], continuation_token
+        token = continuation_token.token
+        lang, country, sort, count = (continuation_token.lang, continuation_token.country, continuation_token.sort,
+                                      continuation_token.count)
+        filter_score_with = continuation_token.filter_score_with
+        filter_device_with = continuation_token.filter_device_with
+
+    url = Formats.Reviews.build(lang=lang, country=country)
+    result = []
+    while len(result) < count:
+        items, token = _fetch_review_items(url, app_id, sort, min(count - len(result), MAX_COUNT_EACH_FETCH),
+                                           filter_score_with, filter_device_with, token)
+        result.extend({key: spec.extract_content(item) for key, spec in ElementSpecs.Review.items()}
+                      for item in items)
+        if isinstance(token, list):
+            token = None
+        if token is None:
+            break
+    return result, _ContinuationToken(token, lang, country, sort, count, filter_score_with, filter_device_with)
+
+# Find where a page of newest-first reviews reaches reviews that are already stored
+def _find_stop_index(batch, stop_at_review_id=None, stop_at_date=None):
+    for index, review in enumerate(batch):
+        if stop_at_review_id and review.get('reviewId') == stop_at_review_id:
+            return index
+        at = review.get('at')
+        if stop_at_date and at and at < stop_at_date:
+            return index
+    return None
+
+# Yield (page, continuation_token) pairs as reviews are fetched, with a callback for UI updates.
+# Pass a saved continuation_token to resume paging where an earlier fetch left off.
+# Requests are paced by the shared adaptive rate limiter and failed requests are retried with
+# jittered exponential backoff. When stop_at_review_id/stop_at_date are given (incremental mode),
+# paging stops as soon as a review at or older than that high-water mark is reached. If a page
+# still fails after max_retries attempts, the last error is raised so callers know the fetch is
+# incomplete. Returns True once the end of the review list was reached (False when it stopped at
+# stored reviews).
+def iter_review_pages(app_id, batch_size=100, max_retries=FETCH_MAX_RETRIES, update_ui=None,
+                      stop_at_review_id=None, stop_at_date=None, rate_limiter=None, continuation_token=None):
+    rate_limiter = rate_limiter or get_rate_limiter()
     total_fetched = 0
 
-    try:
-        message = "Starting review fetch..."
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+    message = ProgressEvent("Resuming review fetch from checkpoint..." if continuation_token else "Starting review fetch...",
+                            'fetch_start', app_id=app_id, resumed=continuation_token is not None)
+    logging.info(message)
+    if update_ui:
+        update_ui(message)
 
+    reached_stored = False
+    while True:
+        retries = 0
         while True:
-            retries = 0
-            while retries < max_retries:
-                try:
-                    result, continuation_token = reviews(
-                        app_id,
-                        lang='en',
-                        country='us',
-                        sort=Sort.NEWEST,
-                        count=batch_size,
-                        continuation_token=continuation_token
-                    )
-                    all_reviews.extend(result)
-                    total_fetched += len(result)
-                    message = f"Fetched batch of {len(result)} reviews. Total: {total_fetched}"
-                    logging.info(message)
-                    if update_ui:
-                        update_ui(message)
-                    break
-                except Exception as e:
-                    retries += 1
-                    message = f"Error fetching batch (attempt {retries}/{max_retries}): {e}"
-                    logging.warning(message)
-                    if update_ui:
-                        update_ui(message)
-                    if retries == max_retries:
-                        message = "Max retries reached. Skipping batch."
-                        logging.error(message)
-                        if update_ui:
-                            update_ui(message)
-                        break
-                    time.sleep(delay * retries)
-            if not result or continuation_token is None:
-                message = "No more reviews to fetch."
-                logging.info(message)
+            start_time = time.perf_counter()
+            rate_limiter.acquire()
+            observe('fetch_rate_limit_wait', time.perf_counter() - start_time)
+            start_time = time.perf_counter()
+            try:
+                result, continuation_token = fetch_reviews_page(
+                    app_id,
+                    lang='en',
+                    country='us',
+                    sort=Sort.NEWEST,
+                    count=batch_size,
+                    continuation_token=continuation_token
+                )
+                observe('fetch_page', time.perf_counter() - start_time, len(result))
+                rate_limiter.record_success()
+                break
+            except Exception as e:
+                increment('fetch_errors')
+                retries += 1
+                message = ProgressEvent(f"Error fetching batch (attempt {retries}/{max_retries}): {e}", 'fetch_retry',
+                                        app_id=app_id, attempt=retries, max_retries=max_retries, error=str(e))
+                logging.warning(message)
                 if update_ui:
                     update_ui(message)
-                break
-            time.sleep(delay)
+                if retries >= max_retries:
+                    message = "Max retries reached. Stopping fetch."
+                    logging.error(message)
+                    if update_ui:
+                        update_ui(message)
+                    raise
+                rate_limiter.record_failure(backoff_delay(retries, FETCH_BACKOFF_BASE, FETCH_BACKOFF_CAP))
+
+        stop_index = _find_stop_index(result, stop_at_review_id, stop_at_date)
+        if stop_index is not None:
+            result = result[:stop_index]
+            reached_stored = True
+        total_fetched += len(result)
+        message = ProgressEvent(f"Fetched batch of {len(result)} reviews. Total: {total_fetched}", 'fetch_page',
+                                app_id=app_id, page_reviews=len(result), fetched=total_fetched)
+        logging.info(message)
+        if update_ui:
+            update_ui(message)
+        if result:
+            yield result, continuation_token
+
+        if reached_stored:
+            message = "Reached already stored reviews. Stopping fetch."
+            logging.info(message)
+            if update_ui:
+                update_ui(message)
+            return False
+        if not result or continuation_token.token is None:
+            message = "No more reviews to fetch."
+            logging.info(message)
+            if update_ui:
+                update_ui(message)
+            return True
+
+# Fetch reviews with pagination, with a callback for UI updates. A page that still fails after
+# max_retries raises instead of returning the reviews fetched so far as if they were complete.
+def fetch_all_reviews(app_id, batch_size=100, max_retries=FETCH_MAX_RETRIES, update_ui=None,
+                      stop_at_review_id=None, stop_at_date=None, rate_limiter=None):
+    all_reviews = []
+    try:
+        for page, _ in iter_review_pages(app_id, batch_size=batch_size, max_retries=max_retries,
+                                      update_ui=update_ui, stop_at_review_id=stop_at_review_id,
+                                      stop_at_date=stop_at_date, rate_limiter=rate_limiter):
+            all_reviews.extend(page)
     except Exception as e:
         message = f"Error fetching reviews: {e}"
         logging.error(message)
         if update_ui:
             update_ui(message)
-        return all_reviews
+        raise
 
     return all_reviews
@@ -0,0 +1,103 @@
+import logging
+import threading
+from collections import deque
+from config import TAG_RULE_WORD_BOUNDARIES
+from db import load_tag_rules, get_tag_rules_version
+
+
+# Aho-Corasick automaton over all keywords of an app's tag rules, so every rule
+# can be matched in a single pass over the review text
+class KeywordMatcher:
+    def __init__(self, tag_rules, word_boundaries=False):
+        self.word_boundaries = word_boundaries
+        self.tags = set()
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for tag, keywords in tag_rules.items():
+            for keyword in keywords:
+                keyword = keyword.strip().lower()
+                if keyword:
+                    self._add_keyword(keyword, tag)
+                    self.tags.add(tag)
+        self._build_fail_links()
+
+    # Add a keyword to the trie, recording (tag, keyword length) at its final state
+    def _add_keyword(self, keyword, tag):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append((tag, len(keyword)))
+
+    # Breadth-first construction of failure links, merging outputs of suffix states
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    # Check that the match ending at end_index is not part of a larger word
+    @staticmethod
+    def _at_word_boundaries(text, end_index, length):
+        start_index = end_index - length + 1
+        if start_index > 0 and text[start_index - 1].isalnum():
+            return False
+        if end_index + 1 < len(text) and text[end_index + 1].isalnum():
+            return False
+        return True
+
+    # Return the set of tags whose keywords occur in the text
+    def match(self, text):
+        found = set()
+        if not text or not self.tags:
+            return found
+        text = text.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for tag, length in output[state]:
+                if tag in found:
+                    continue
+                if self.word_boundaries and not self._at_word_boundaries(text, index, length):
+                    continue
+                found.add(tag)
+            if len(found) == len(self.tags):
+                break
+        return found
+
+
+# Compiled matchers per (app_id, word_boundaries), rebuilt when the app's tag rules change
+_MATCHER_CACHE = {}
+_MATCHER_CACHE_LOCK = threading.Lock()
+
+
+# Get the cached keyword matcher for an app's tag rules
+def get_tag_matcher(app_id, word_boundaries=TAG_RULE_WORD_BOUNDARIES):
+    key = (app_id, word_boundaries)
+    version = get_tag_rules_version(app_id)
+    with _MATCHER_CACHE_LOCK:
+        cached = _MATCHER_CACHE.get(key)
+        if cached and version is not None and cached[0] == version:
+            return cached[1]
+    matcher = KeywordMatcher(load_tag_rules(app_id), word_boundaries=word_boundaries)
+    if version is not None:
+        with _MATCHER_CACHE_LOCK:
+            _MATCHER_CACHE[key] = (version, matcher)
+    logging.info(f"Compiled keyword matcher for {app_id} with {len(matcher.tags)} tags")
+    return matcher
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from config import METRICS_WINDOW_SIZE
+
+# Prefix of every exported metric name
+METRICS_PREFIX = 'review_analyzer'
+
+
+# Timings of one pipeline stage: totals since start plus a window of recent durations for percentiles
+class StageTimer:
+    def __init__(self, window_size):
+        self.count = 0
+        self.seconds = 0.0
+        self.items = 0
+        self.recent = deque(maxlen=window_size)
+
+    def observe(self, seconds, items):
+        self.count += 1
+        self.seconds += seconds
+        self.items += items
+        self.recent.append(seconds)
+
+    # Nearest-rank percentile of the recent durations
+    def percentile(self, percent):
+        if not self.recent:
+            return 0.0
+        durations = sorted(self.recent)
+        return durations[min(len(durations) - 1, max(0, int(round(percent / 100 * len(durations))) - 1))]
+
+
+# Process-wide, thread-safe registry of stage timings and counters. Counters may carry labels;
+# stage timers are keyed on the stage name only.
+class MetricsRegistry:
+    def __init__(self, window_size=METRICS_WINDOW_SIZE, clock=time.perf_counter):
+        self.window_size = window_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self.started_at = time.time()
+
+    # Record one run of a stage that took seconds and processed items
+    def observe(self, stage, seconds, items=0):
+        with self._lock:
+            timer = self._stages.get(stage)
+            if timer is None:
+                timer = self._stages[stage] = StageTimer(self.window_size)
+            timer.observe(seconds, items)
+
+    # Time the enclosed block as one run of a stage. The yielded dict's 'items' entry can be set
+    # inside the block when the number of processed items is only known at the end.
+    @contextmanager
+    def span(self, stage, items=0):
+        span = {'items': items}
+        start_time = self._clock()
+        try:
+            yield span
+        finally:
+            self.observe(stage, self._clock() - start_time, span['items'])
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # Per-stage summary: runs, total seconds, items, items/sec and p50/p95 seconds
+    def stage_stats(self):
+        with self._lock:
+            return {stage: {'count': timer.count,
+                            'seconds': timer.seconds,
+                            'items': timer.items,
+                            'items_per_sec': timer.items / timer.seconds if timer.seconds > 0 else 0.0,
+                            'p50_seconds': timer.percentile(50),
+                            'p95_seconds': timer.percentile(95)}
+                    for stage, timer in sorted(self._stages.items())}
+
+    # Counter values as (name, labels dict, value) tuples
+    def counters(self):
+        with self._lock:
+            return [(name, dict(labels), value) for (name, labels), value in sorted(self._counters.items())]
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+
+# Escape a label value for the Prometheus exposition format
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Format a label set in Prometheus exposition syntax
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+# Render a registry in the Prometheus text exposition format
+def prometheus_text(registry=None):
+    registry = registry or METRICS
+    stats = registry.stage_stats()
+    lines = []
+    if stats:
+        name = f"{METRICS_PREFIX}_stage_seconds"
+        lines += [f"# HELP {name} Time spent per pipeline stage (quantiles over the most recent runs).",
+                  f"# TYPE {name} summary"]
+        for stage, stage_stats in stats.items():
+            for quantile, key in (('0.5', 'p50_seconds'), ('0.95', 'p95_seconds')):
+                lines.append(f"{name}{_labels(stage=stage, quantile=quantile)} {stage_stats[key]:.6f}")
+            lines.append(f"{name}_sum{_labels(stage=stage)} {stage_stats['seconds']:.6f}")
+            lines.append(f"{name}_count{_labels(stage=stage)} {stage_stats['count']}")
+        name = f"{METRICS_PREFIX}_stage_items_total"
+        lines += [f"# HELP {name} Items (reviews, pages or rows) processed per pipeline stage.",
+                  f"# TYPE {name} counter"]
+        for stage, stage_stats in stats.items():
+            lines.append(f"{name}{_labels(stage=stage)} {stage_stats['items']}")
+    declared = set()
+    for counter, labels, value in registry.counters():
+        name = f"{METRICS_PREFIX}_{counter}_total"
+        if name not in declared:
+            declared.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(**labels)} {value}")
+    name = f"{METRICS_PREFIX}_metrics_start_time_seconds"
+    lines += [f"# TYPE {name} gauge", f"{name} {registry.started_at:.3f}"]
+    return '\n'.join(lines) + '\n'
+
+
+# Registry shared by the whole process (Streamlit sessions, scheduler threads, CLI workers)
+METRICS = MetricsRegistry()
+
+# Time the enclosed block as one run of a stage in the shared registry
+def span(stage, items=0):
+    return METRICS.span(stage, items)
+
+# Record one run of a stage in the shared registry
+def observe(stage, seconds, items=0):
+    METRICS.observe(stage, seconds, items)
+
+# Increment a counter in the shared registry
+def increment(name, value=1, **labels):
+    METRICS.increment(name, value, **labels)
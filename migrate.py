@@ -1,103 +1,194 @@
+import io
+import json
 import sqlite3
-import pandas as pd
-import psycopg2
-from psycopg2 import sql
+import time
 import logging
+import psycopg2
+from config import DB_PATH, POSTGRES_DSN, MIGRATION_CHUNK_SIZE
+from metrics import observe
+from progress import ProgressEvent
+from storage import PostgresBackend, PostgresCursor
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# Streaming SQLite -> PostgreSQL migration. Each table is read from SQLite in key order, one chunk at a
+# time, bulk loaded with COPY into a temporary staging table and upserted from there. The chunk's
+# upsert and the table's watermark (the key of the last copied row) commit in one transaction, so a
+# migration that fails part way leaves every finished chunk in place and the next run resumes after it.
+# Nothing is deleted: rows already in PostgreSQL are updated only when they differ.
 
-# SQLite connection
-def get_sqlite_data():
-    try:
-        conn = sqlite3.connect('reviews.db')
-        df = pd.read_sql_query("SELECT * FROM reviews", conn)
-        conn.close()
-        logging.info(f"Fetched {len(df)} reviews from SQLite.")
-        return df
-    except Exception as e:
-        logging.error(f"Error reading from SQLite: {e}")
-        return None
+# Tables copied, in order, as (table, columns, key columns)
+MIGRATED_TABLES = [
+    ('app_ids', ['app_id'], ['app_id']),
+    ('tag_rules', ['app_id', 'tag_name', 'keywords'], ['app_id', 'tag_name']),
+    ('extracted_tags', ['app_id', 'tag_name'], ['app_id', 'tag_name']),
+    ('reviews', ['app_id', 'review_id', 'username', 'date', 'rating', 'review_text', 'sentiment',
+                 'sentiment_score', 'tags'], ['review_id']),
+    ('review_tags', ['app_id', 'review_id', 'tag'], ['review_id', 'tag']),
+]
 
-# PostgreSQL connection
-def init_postgres():
-    try:
-        conn = psycopg2.connect(
-            dbname="reviews",
-            user="saodatJustdice",
-            password="",  # Replace with your PostgreSQL password
-            host="localhost",
-            port="5432"
-        )
-        cursor = conn.cursor()
-        # Create reviews table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS reviews (
-                app_id TEXT,
-                review_id TEXT PRIMARY KEY,
-                username TEXT,
-                date TEXT,
-                rating INTEGER,
-                review_text TEXT,
-                sentiment TEXT,
-                sentiment_score FLOAT,
-                tags TEXT
-            );
-        """)
-        conn.commit()
-        logging.info("PostgreSQL table initialized successfully.")
-        return conn
-    except Exception as e:
-        logging.error(f"Error initializing PostgreSQL: {e}")
-        return None
-
-# Migrate data
-def migrate_data():
-    # Fetch data from SQLite
-    df = get_sqlite_data()
-    if df is None or df.empty:
-        logging.error("No data to migrate.")
-        return
-
-    # Connect to PostgreSQL
-    conn = init_postgres()
-    if conn is None:
-        return
-
-    cursor = conn.cursor()
+# Per-table migration watermarks (the tables themselves are created by storage.PostgresBackend)
+MIGRATION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS migration_watermarks (
+        table_name TEXT PRIMARY KEY,
+        last_key TEXT,
+        rows BIGINT,
+        updated_at TIMESTAMP DEFAULT now()
+    )
+'''
+
+# Open the SQLite database read-only, so the migration never takes a write lock on it
+def _connect_sqlite(sqlite_path):
+    return sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+
+# Create the PostgreSQL tables if needed, with the same schema, rollups and triggers db.py uses with
+# STORAGE_BACKEND = 'postgresql', so the migrated database can be used as the app's database directly
+def init_postgres(conn):
+    with conn.cursor() as cursor:
+        PostgresBackend(conn.dsn).create_schema(PostgresCursor(cursor))
+        cursor.execute(MIGRATION_SCHEMA)
+    conn.commit()
+    logging.info("PostgreSQL tables initialized successfully.")
+
+# Key of the last row copied by an interrupted migration of a table, and the rows copied so far
+def _load_watermark(cursor, table):
+    cursor.execute("SELECT last_key, rows FROM migration_watermarks WHERE table_name = %s", (table,))
+    row = cursor.fetchone()
+    if row is None:
+        return None, 0
+    return json.loads(row[0]), row[1]
+
+# Record the key of the last row copied for a table
+def _save_watermark(cursor, table, last_key, rows):
+    cursor.execute('''
+        INSERT INTO migration_watermarks (table_name, last_key, rows, updated_at) VALUES (%s, %s, %s, now())
+        ON CONFLICT (table_name) DO UPDATE SET last_key = EXCLUDED.last_key, rows = EXCLUDED.rows,
+                                               updated_at = EXCLUDED.updated_at
+    ''', (table, json.dumps(list(last_key)), rows))
+
+# Read the next chunk of a table from SQLite, in key order after the watermark
+def _read_chunk(sqlite_conn, table, columns, key_columns, watermark, chunk_size):
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    params = []
+    if watermark is not None:
+        query += f" WHERE ({', '.join(key_columns)}) > ({', '.join('?' * len(key_columns))})"
+        params.extend(watermark)
+    query += f" ORDER BY {', '.join(key_columns)} LIMIT ?"
+    params.append(chunk_size)
+    return sqlite_conn.execute(query, params).fetchall()
+
+# Format a value for COPY's text format
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+# COPY rows into the staging table and upsert them into the table; returns the number of rows
+# inserted or changed
+def _load_chunk(cursor, table, columns, key_columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    column_list = ', '.join(columns)
+    cursor.copy_expert(f"COPY {table}_staging ({column_list}) FROM STDIN", buffer)
+
+    values = [column for column in columns if column not in key_columns]
+    if values:
+        conflict = (f"DO UPDATE SET {', '.join(f'{column} = EXCLUDED.{column}' for column in values)} "
+                    f"WHERE ({', '.join(f'{table}.{column}' for column in values)}) IS DISTINCT FROM "
+                    f"({', '.join(f'EXCLUDED.{column}' for column in values)})")
+    else:
+        conflict = "DO NOTHING"
+    cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {table}_staging "
+                   f"ON CONFLICT ({', '.join(key_columns)}) {conflict}")
+    written = cursor.rowcount
+    cursor.execute(f"TRUNCATE {table}_staging")
+    return written
+
+# Copy one table in chunks, resuming after its watermark; returns (rows copied, rows inserted or changed)
+def _migrate_table(sqlite_conn, pg_conn, table, columns, key_columns, chunk_size, update_ui=None):
+    key_indexes = [columns.index(column) for column in key_columns]
+    with pg_conn.cursor() as cursor:
+        cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {table}_staging "
+                       f"(LIKE {table} INCLUDING DEFAULTS)")
+        watermark, copied = _load_watermark(cursor, table)
+    pg_conn.commit()
+    if watermark is not None:
+        logging.info(f"Resuming migration of {table} after {copied} rows")
+
+    written, resumed_rows = 0, copied
+    start_time = time.perf_counter()
+    while True:
+        rows = _read_chunk(sqlite_conn, table, columns, key_columns, watermark, chunk_size)
+        if not rows:
+            break
+        chunk_start = time.perf_counter()
+        watermark = [rows[-1][index] for index in key_indexes]
+        with pg_conn.cursor() as cursor:
+            written += _load_chunk(cursor, table, columns, key_columns, rows)
+            _save_watermark(cursor, table, watermark, copied + len(rows))
+        pg_conn.commit()
+        copied += len(rows)
+        chunk_seconds = time.perf_counter() - chunk_start
+        observe('migrate_chunk', chunk_seconds, len(rows))
+
+        elapsed = time.perf_counter() - start_time
+        rows_per_sec = (copied - resumed_rows) / elapsed if elapsed > 0 else 0.0
+        message = ProgressEvent(f"Migrated {copied} rows of {table} ({rows_per_sec:,.0f} rows/sec)", 'migrate_chunk',
+                                table=table, rows=copied, chunk_rows=len(rows), chunk_seconds=round(chunk_seconds, 3),
+                                rows_per_sec=round(rows_per_sec, 1))
+        logging.info(message)
+        if update_ui:
+            update_ui(message)
+
+    with pg_conn.cursor() as cursor:
+        cursor.execute(f"ANALYZE {table}")
+    pg_conn.commit()
+    return copied, written
+
+# Migrate every table in MIGRATED_TABLES from SQLite to PostgreSQL. With resume=False the watermarks
+# of an interrupted migration are discarded and every table is copied from the start. Raises on failure
+# (finished chunks stay committed); returns a summary with rows per table and throughput.
+def migrate_data(sqlite_path=DB_PATH, dsn=POSTGRES_DSN, chunk_size=MIGRATION_CHUNK_SIZE, resume=True, update_ui=None):
+    start_time = time.perf_counter()
+    sqlite_conn = _connect_sqlite(sqlite_path)
+    pg_conn = None
     try:
-        # Clear existing data (optional, remove if you want to append)
-        cursor.execute("DELETE FROM reviews;")
-
-        # Insert data into PostgreSQL
-        for _, row in df.iterrows():
-            cursor.execute("""
-                INSERT INTO reviews (app_id, review_id, username, date, rating, review_text, sentiment, sentiment_score, tags)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (review_id) DO NOTHING;
-            """, (
-                row['app_id'],
-                row['review_id'],
-                row['username'],
-                str(row['date']),  # Convert Timestamp to string
-                row['rating'],
-                row['review_text'],
-                row['sentiment'],
-                row['sentiment_score'],
-                row['tags']
-            ))
-        conn.commit()
-        logging.info(f"Migrated {len(df)} reviews to PostgreSQL.")
+        pg_conn = psycopg2.connect(dsn)
+        init_postgres(pg_conn)
+        if not resume:
+            with pg_conn.cursor() as cursor:
+                cursor.execute("DELETE FROM migration_watermarks")
+            pg_conn.commit()
+
+        tables = {}
+        for table, columns, key_columns in MIGRATED_TABLES:
+            copied, written = _migrate_table(sqlite_conn, pg_conn, table, columns, key_columns, chunk_size, update_ui)
+            tables[table] = {'rows': copied, 'written': written}
+
+        # Complete: the next run copies everything again (upserting only differences)
+        with pg_conn.cursor() as cursor:
+            cursor.execute("DELETE FROM migration_watermarks")
+        pg_conn.commit()
     except Exception as e:
         logging.error(f"Error migrating data to PostgreSQL: {e}")
-        conn.rollback()
+        if pg_conn is not None:
+            pg_conn.rollback()
+        raise
     finally:
-        cursor.close()
-        conn.close()
+        sqlite_conn.close()
+        if pg_conn is not None:
+            pg_conn.close()
+
+    seconds = time.perf_counter() - start_time
+    rows = sum(table['rows'] for table in tables.values())
+    summary = {'rows': rows, 'seconds': round(seconds, 3),
+               'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else 0.0, 'tables': tables}
+    logging.info(f"Migrated {rows} rows to PostgreSQL in {seconds:.1f} seconds ({summary['rows_per_sec']:,.0f} rows/sec): "
+                 + ', '.join(f"{table} {counts['rows']} ({counts['written']} new or changed)"
+                             for table, counts in tables.items()))
+    return summary
 
 if __name__ == "__main__":
     migrate_data()
@@ -0,0 +1,59 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+from db import get_refresh_jobs, get_stale_refresh_jobs
+from config import REFRESH_JOB_LEASE_MINUTES
+from metrics import METRICS, prometheus_text
+
+
+def show_diagnostics(app_id='cashgiraffe.app'):
+    st.header("Diagnostics")
+    started_at = datetime.fromtimestamp(METRICS.started_at).strftime('%Y-%m-%d %H:%M:%S')
+    st.markdown(f"Pipeline timings of this server process since {started_at}. "
+                f"Percentiles cover the most recent {METRICS.window_size} runs of each stage.")
+
+    stats = METRICS.stage_stats()
+    st.subheader("Stage Timings")
+    if stats:
+        stage_table = pd.DataFrame.from_dict(stats, orient='index')
+        stage_table.index.name = 'stage'
+        stage_table = stage_table.rename(columns={
+            'count': 'Runs', 'seconds': 'Total (s)', 'items': 'Items', 'items_per_sec': 'Items/sec',
+            'p50_seconds': 'p50 (s)', 'p95_seconds': 'p95 (s)'})
+        st.dataframe(stage_table.style.format({'Total (s)': '{:.3f}', 'Items/sec': '{:,.1f}',
+                                               'p50 (s)': '{:.4f}', 'p95 (s)': '{:.4f}'}))
+        if 'db_lock_wait' in stats:
+            lock_wait = stats['db_lock_wait']
+            col1, col2, col3 = st.columns(3)
+            col1.metric("DB lock wait (total)", f"{lock_wait['seconds']:.2f}s")
+            col2.metric("DB lock wait p95", f"{lock_wait['p95_seconds'] * 1000:.1f}ms")
+            col3.metric("Write transactions", lock_wait['count'])
+    else:
+        st.write("No pipeline activity recorded yet. Refresh or re-tag reviews to collect timings.")
+
+    counters = METRICS.counters()
+    if counters:
+        st.subheader("Counters")
+        st.dataframe(pd.DataFrame([{'counter': name, 'labels': ', '.join(f"{key}={value}" for key, value in labels.items()),
+                                    'value': value} for name, labels, value in counters]))
+
+    st.subheader("Recent Refresh Jobs")
+    stale = get_stale_refresh_jobs(REFRESH_JOB_LEASE_MINUTES)
+    if not stale.empty:
+        st.warning(f"{len(stale)} refresh jobs are marked running but have not sent a heartbeat for more than "
+                   f"{REFRESH_JOB_LEASE_MINUTES} minutes (apps: {', '.join(sorted(set(stale['app_id'])))}). "
+                   f"They are marked abandoned when the next refresh job starts.")
+    jobs = get_refresh_jobs(app_id, limit=20)
+    if not jobs.empty:
+        st.dataframe(jobs)
+    else:
+        st.write("No refresh jobs recorded for this app.")
+
+    st.subheader("Prometheus Metrics")
+    text = prometheus_text()
+    st.download_button("Download metrics", text, file_name='metrics.prom', mime='text/plain')
+    with st.expander("Show metrics text"):
+        st.code(text, language='text')
+    if st.button("Reset metrics"):
+        METRICS.reset()
+        st.experimental_rerun()
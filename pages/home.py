@@ -1,11 +1,14 @@
 import streamlit as st
-from db import get_reviews
-from utils import refresh_reviews
+import pandas as pd
+from db import get_review_summary, get_tag_counts
+from scheduler import run_refresh_job
 
 def show_home(app_id='cashgiraffe.app'):
     st.header("Home")
     st.markdown("Welcome to the Play Store Review Analyzer! Fetch and analyze reviews for your app.")
 
+    incremental = st.checkbox("Only fetch new reviews", value=True,
+                              help="Stop at reviews that are already stored instead of re-downloading everything.")
     if st.button("Refresh Reviews"):
         progress_placeholder = st.empty()
 
@@ -13,17 +16,18 @@ def show_home(app_id='cashgiraffe.app'):
             progress_placeholder.info(message)
 
         with st.spinner("Fetching reviews..."):
-            df, message = refresh_reviews(app_id, update_ui=update_progress)
+            summary, message = run_refresh_job(app_id, incremental=incremental, trigger='manual',
+                                               update_ui=update_progress)
 
         progress_placeholder.empty()
-        if df is not None:
+        if summary is not None:
             st.success(message)
         else:
             st.error(message)
 
     try:
-        df = get_reviews(app_id)
-        if df.empty:
+        summary = get_review_summary(app_id)
+        if not summary['reviews']:
             st.warning("No reviews available. Please click 'Refresh Reviews' to fetch reviews.")
             return
     except Exception as e:
@@ -32,18 +36,18 @@ def show_home(app_id='cashgiraffe.app'):
 
     st.subheader("Summary Statistics")
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total Reviews", len(df))
-    col2.metric("Average Rating", round(df['rating'].mean(), 2))
-    col3.metric("Positive Reviews", len(df[df['sentiment'] == 'Positive']))
+    col1.metric("Total Reviews", summary['reviews'])
+    col2.metric("Average Rating", round(summary['average_rating'], 2))
+    col3.metric("Positive Reviews", summary['Positive'])
 
     st.subheader("Sentiment Distribution")
-    sentiment_counts = df['sentiment'].value_counts()
+    sentiment_counts = pd.Series({sentiment: summary[sentiment] for sentiment in ['Positive', 'Negative', 'Neutral']
+                                  if summary[sentiment]}, name='count').sort_values(ascending=False)
     st.bar_chart(sentiment_counts)
 
     st.subheader("Top Tags")
-    if df['tags'].notnull().any():
-        tags = df['tags'].str.split(',', expand=True).stack().str.strip()
-        tag_counts = tags.value_counts().head(5)
+    tag_counts = get_tag_counts(app_id, limit=5)
+    if not tag_counts.empty:
         st.bar_chart(tag_counts)
     else:
         st.write("No tags available.")
@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from db import get_reviews, clear_reviews_cache
+from db import get_reviews_page, get_review_date_range, get_app_tags, search_reviews
 from datetime import datetime, timedelta
 
 def show_reviews(app_id='cashgiraffe.app'):
@@ -8,29 +8,22 @@ def show_reviews(app_id='cashgiraffe.app'):
     st.markdown("View and analyze individual reviews for the selected app.")
 
     try:
-        #Fetch all reviews to initialize the date filter
-        clear_reviews_cache()
-        df = get_reviews(app_id)
-        if df.empty:
+        # Only the date bounds are needed to initialize the date filter
+        min_date, max_date = get_review_date_range(app_id)
+        if min_date is None:
             st.warning("No reviews available. Please fetch reviews from the Home page.")
             return
     except Exception as e:
         st.error(f"Error loading reviews: {e}")
         return
 
-    if 'reviews_page' not in st.session_state:
-        st.session_state['reviews_page'] = 0
+    search_query = st.text_input("Search reviews", placeholder='e.g. crash "dark mode" withdraw*').strip()
 
+    start_date, end_date = None, None
     with st.sidebar:
         st.subheader("Date Filter")
-        min_date = df['date'].min()
-        max_date = df['date'].max()
         date_range = st.date_input("Date Range", [min_date, max_date], key="date_range")
 
-
-
-
-
         if len(date_range) == 2:
             start_date = date_range[0]
             end_date = date_range[1]
@@ -38,71 +31,67 @@ def show_reviews(app_id='cashgiraffe.app'):
             if start_date > end_date:
                 st.warning("Start date must be before end date.")
                 return
-                # Fetch reviews based on the date_range
-            df = get_reviews(app_id, start_date, end_date)
-
-
 
         st.subheader("Filters")
         sentiment_filter = st.multiselect("Sentiment", options=['Positive', 'Negative', 'Neutral'],
-                                          default=['Positive', 'Negative', 'Neutral'], on_change=clear_reviews_cache)
-        rating_filter = st.slider("Rating", min_value=1, max_value=5, value=(1, 5), on_change=clear_reviews_cache)
-        tags_filter = st.multiselect("Tags",
-                                     options=sorted(
-                                         set(tag for tags in df['tags'].dropna() for tag in tags.split(','))), on_change=clear_reviews_cache)
-
-
-
-
-    filtered_df = df
-
-
-    # Apply other filters
-    filtered_df = filtered_df[
-        (filtered_df['sentiment'].isin(sentiment_filter)) &
-        (filtered_df['rating'].between(rating_filter[0], rating_filter[1]))
-        ]
-    if tags_filter:
-        filtered_df = filtered_df[filtered_df['tags'].notnull()]
-        filtered_df = filtered_df[filtered_df['tags'].apply(lambda x: any(tag in x.split(',') for tag in tags_filter))]
-
-    total_reviews = len(filtered_df)
+                                          default=['Positive', 'Negative', 'Neutral'])
+        rating_filter = st.slider("Rating", min_value=1, max_value=5, value=(1, 5))
+        tags_filter = st.multiselect("Tags", options=get_app_tags(app_id))
 
     # Pagination
     st.sidebar.subheader("Pagination")
     items_per_page = st.sidebar.selectbox("Items per page", [10, 20, 50, 100], index=1)
+
+    # Cursors of the pages visited so far (keyset for browsing, offsets for ranked search results);
+    # start over whenever the filters change
+    filters = (app_id, search_query, start_date, end_date, tuple(sentiment_filter), rating_filter,
+               tuple(tags_filter), items_per_page)
+    if st.session_state.get('reviews_filters') != filters:
+        st.session_state['reviews_filters'] = filters
+        st.session_state['reviews_cursors'] = [None]
+    cursors = st.session_state['reviews_cursors']
+
+    if search_query:
+        page_df, total_reviews = search_reviews(app_id, search_query, start_date, end_date, sentiment_filter,
+                                                rating_filter, tags_filter, limit=items_per_page,
+                                                offset=cursors[-1] or 0)
+    else:
+        page_df, total_reviews = get_reviews_page(app_id, start_date, end_date, sentiment_filter, rating_filter,
+                                                  tags_filter, page_size=items_per_page, after=cursors[-1])
     total_pages = (total_reviews + items_per_page - 1) // items_per_page
 
     if total_pages > 1:
         col1, col2 = st.columns(2)
         with col1:
-            if st.button("Previous", key="previous_button", disabled=(st.session_state['reviews_page'] == 0)):
-                st.session_state['reviews_page'] -= 1
-                clear_reviews_cache()
+            if st.button("Previous", key="previous_button", disabled=(len(cursors) == 1)):
+                cursors.pop()
+                st.experimental_rerun()
         with col2:
-            if st.button("Next", key="next_button", disabled=(st.session_state['reviews_page'] == total_pages -1)):
-                st.session_state['reviews_page'] += 1
-                clear_reviews_cache()
-
-    start_index = st.session_state['reviews_page'] * items_per_page
-    end_index = start_index + items_per_page
-    paginated_df = filtered_df[start_index:end_index]
+            if st.button("Next", key="next_button", disabled=(len(cursors) >= total_pages or page_df.empty)):
+                if search_query:
+                    cursors.append(len(cursors) * items_per_page)
+                else:
+                    last = page_df.iloc[-1]
+                    cursors.append((last['date'], last['review_id']))
+                st.experimental_rerun()
+        st.caption(f"Page {len(cursors)} of {total_pages}")
 
     # Apply deferred operations
-    paginated_df['date'] = pd.to_datetime(paginated_df['date'])
-    has_duplicates = paginated_df['username'].duplicated().any()
+    page_df['date'] = pd.to_datetime(page_df['date'])
+    has_duplicates = page_df['username'].duplicated().any()
     if has_duplicates:
-        paginated_df['display_username'] = paginated_df.apply(lambda x: f"{x['username']} (ID: {x['review_id'][-4:]})", axis=1)
+        page_df['display_username'] = page_df.apply(lambda x: f"{x['username']} (ID: {x['review_id'][-4:]})", axis=1)
     else:
-        paginated_df['display_username'] = paginated_df['username']
+        page_df['display_username'] = page_df['username']
 
-    st.subheader(f"Reviews ({total_reviews})")
+    st.subheader(f"Search results ({total_reviews})" if search_query else f"Reviews ({total_reviews})")
     if total_reviews > 0:
-        for idx, row in paginated_df.iterrows():
+        for idx, row in page_df.iterrows():
             with st.expander(f"{row['display_username']} - {row['rating']} ★ - {row['sentiment']}", expanded=1):
                 st.write(f"**Date:** {row['date']}")
+                if search_query:
+                    st.write(f"**Match:** {row['snippet']}")
                 st.write(f"**Review:** {row['review_text']}")
                 st.write(f"**Tags:** {row['tags'] if row['tags'] else 'None'}")
     else:
         st.write("No results found")
-
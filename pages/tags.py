@@ -1,6 +1,6 @@
 import streamlit as st
-from db import load_tag_rules, load_extracted_tags, add_tag_rule, delete_tag_rule, delete_extracted_tag
-from tagger import auto_tag_reviews
+from db import load_tag_rules, load_extracted_tags, delete_extracted_tag
+from tagger import auto_tag_reviews, save_tag_rule, remove_tag_rule
 
 
 def show_tags(app_id='cashgiraffe.app'):
@@ -21,8 +21,10 @@ def show_tags(app_id='cashgiraffe.app'):
             if tag_name and keywords:
                 try:
                     keywords_list = [kw.strip() for kw in keywords.split(',')]
-                    add_tag_rule(app_id, tag_name, keywords_list)
-                    st.success(f"Added tag rule: {tag_name}")
+                    with st.spinner("Re-tagging affected reviews..."):
+                        stats = save_tag_rule(app_id, tag_name, keywords_list)
+                    st.success(f"Added tag rule: {tag_name} ({stats['changed']} of {stats['reviews']} "
+                               f"matching reviews re-tagged)")
                     st.experimental_rerun()
                 except Exception as e:
                     st.error(f"Error adding tag rule: {e}")
@@ -37,8 +39,9 @@ def show_tags(app_id='cashgiraffe.app'):
                 st.write(f"**Keywords:** {', '.join(keywords)}")
                 if st.button(f"Delete {tag}", key=f"delete_rule_{tag}"):
                     try:
-                        delete_tag_rule(app_id, tag)
-                        st.success(f"Deleted tag rule: {tag}")
+                        with st.spinner("Re-tagging affected reviews..."):
+                            stats = remove_tag_rule(app_id, tag)
+                        st.success(f"Deleted tag rule: {tag} ({stats['changed']} reviews re-tagged)")
                         st.experimental_rerun()
                     except Exception as e:
                         st.error(f"Error deleting tag rule: {e}")
@@ -87,7 +90,11 @@ def show_tags(app_id='cashgiraffe.app'):
     st.subheader("Auto-Tag Reviews")
     if st.button("Run Auto-Tagging"):
         try:
-            auto_tag_reviews(app_id)
-            st.success("Auto-tagging completed successfully!")
+            stats = auto_tag_reviews(app_id)
+            if stats:
+                st.success(f"Auto-tagging completed successfully! Tagged {stats['reviews']} reviews "
+                           f"at {stats['rows_per_sec']:.0f} rows/sec.")
+            else:
+                st.warning("No tag rules defined; nothing to auto-tag.")
         except Exception as e:
             st.error(f"Error during auto-tagging: {e}")
@@ -1,15 +1,16 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-from db import get_reviews
+from db import get_daily_review_stats, get_daily_tag_counts
 
 def show_trends(app_id='cashgiraffe.app'):
     st.header("Trends")
     st.markdown("Analyze trends in reviews over time for the selected app.")
 
     try:
-        df = get_reviews(app_id)
-        if df.empty:
+        # One pre-aggregated row per day instead of every review
+        daily_stats = get_daily_review_stats(app_id)
+        if daily_stats.empty:
             st.warning("No reviews available. Please fetch reviews from the Home page.")
             return
     except Exception as e:
@@ -18,8 +19,8 @@ def show_trends(app_id='cashgiraffe.app'):
 
     # Date range filter
     st.subheader("Date Range")
-    min_date = df['date'].min().date()
-    max_date = df['date'].max().date()
+    min_date = daily_stats['date'].min().date()
+    max_date = daily_stats['date'].max().date()
     date_range = st.date_input("Select date range", [min_date, max_date], min_value=min_date, max_value=max_date)
 
     if len(date_range) != 2:
@@ -27,15 +28,16 @@ def show_trends(app_id='cashgiraffe.app'):
         return
 
     start_date, end_date = date_range
-    filtered_df = df[(df['date'].dt.date >= start_date) & (df['date'].dt.date <= end_date)]
+    filtered_stats = daily_stats[(daily_stats['date'].dt.date >= start_date) & (daily_stats['date'].dt.date <= end_date)]
 
-    if filtered_df.empty:
+    if filtered_stats.empty:
         st.warning("No reviews in the selected date range.")
         return
 
     # Rating trend
     st.subheader("Average Rating Over Time")
-    rating_trend = filtered_df.groupby(filtered_df['date'].dt.date)['rating'].mean().reset_index()
+    rating_trend = pd.DataFrame({'date': filtered_stats['date'],
+                                 'rating': filtered_stats['rating_sum'] / filtered_stats['reviews']})
     rating_chart = alt.Chart(rating_trend).mark_line().encode(
         x='date:T',
         y='rating:Q',
@@ -45,7 +47,8 @@ def show_trends(app_id='cashgiraffe.app'):
 
     # Sentiment trend
     st.subheader("Sentiment Distribution Over Time")
-    sentiment_trend = filtered_df.groupby([filtered_df['date'].dt.date, 'sentiment']).size().unstack().fillna(0).reset_index()
+    sentiment_trend = filtered_stats[['date', 'positive', 'negative', 'neutral']].rename(
+        columns={'positive': 'Positive', 'negative': 'Negative', 'neutral': 'Neutral'})
     sentiment_melted = sentiment_trend.melt('date', var_name='sentiment', value_name='count')
     sentiment_chart = alt.Chart(sentiment_melted).mark_area().encode(
         x='date:T',
@@ -57,16 +60,9 @@ def show_trends(app_id='cashgiraffe.app'):
 
     # Tag trend
     st.subheader("Tag Trends Over Time")
-    if filtered_df['tags'].notnull().any():
-        tags_df = filtered_df[['date', 'tags']].copy()
-        tags_df = tags_df[tags_df['tags'].notnull()]
-        tags_df['tags'] = tags_df['tags'].str.split(',')
-        tags_exploded = tags_df.explode('tags')
-        tags_exploded['tags'] = tags_exploded['tags'].str.strip()
-        tags_exploded = tags_exploded.rename(columns={'date': 'date_group'})
-        tag_trend = tags_exploded.groupby([tags_exploded['date_group'].dt.date, 'tags']).size().unstack().fillna(0).reset_index()
-        top_tags = tags_exploded['tags'].value_counts().head(5).index
-        tag_trend = tag_trend[['date'] + list(top_tags)]
+    tag_counts = get_daily_tag_counts(app_id, start_date, end_date, top_n=5)
+    if not tag_counts.empty:
+        tag_trend = tag_counts.pivot(index='date', columns='tags', values='count').fillna(0).reset_index()
         tag_melted = tag_trend.melt('date', var_name='tags', value_name='count')
         tag_chart = alt.Chart(tag_melted).mark_line().encode(
             x='date:T',
@@ -0,0 +1,23 @@
+import time
+
+
+# A progress message that also carries structured fields. It is a str, so update_ui callbacks that
+# display text (the Streamlit pages) keep working, while headless callbacks (cli.py) can emit the
+# stage and fields as machine-readable events.
+class ProgressEvent(str):
+    def __new__(cls, message, stage, **fields):
+        event = super().__new__(cls, message)
+        event.stage = stage
+        event.fields = fields
+        event.timestamp = time.time()
+        return event
+
+    def to_dict(self):
+        return {'stage': self.stage, 'message': str(self), 'timestamp': self.timestamp, **self.fields}
+
+
+# Convert any update_ui message to an event dict; plain strings become 'log' events
+def event_dict(message):
+    if isinstance(message, ProgressEvent):
+        return message.to_dict()
+    return {'stage': 'log', 'message': str(message), 'timestamp': time.time()}
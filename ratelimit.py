@@ -0,0 +1,56 @@
+import logging
+import random
+import threading
+import time
+
+
+# Token bucket shared by all fetches in the process, implemented as a generic cell rate
+# algorithm so waiting callers reserve their slot instead of polling. The refill rate adapts to
+# upstream health: it grows additively after successful requests and is cut multiplicatively on
+# failures, and a failure also pauses every caller for a backoff delay.
+class AdaptiveRateLimiter:
+    def __init__(self, rate, burst, min_rate, max_rate, increase_step, decrease_factor,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._theoretical_arrival = clock()
+        self._blocked_until = 0.0
+
+    # Block until a request may be sent
+    def acquire(self):
+        with self._lock:
+            now = self._clock()
+            interval = 1.0 / self.rate
+            earliest = max(self._theoretical_arrival - (self.burst - 1) * interval, self._blocked_until)
+            send_at = max(now, earliest)
+            self._theoretical_arrival = max(self._theoretical_arrival, send_at) + interval
+            wait = send_at - now
+        if wait > 0:
+            self._sleep(wait)
+
+    # A request succeeded: speed up
+    def record_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    # A request failed: slow down and pause all callers for backoff_seconds
+    def record_failure(self, backoff_seconds):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._blocked_until = max(self._blocked_until, self._clock() + backoff_seconds)
+            self._theoretical_arrival = max(self._theoretical_arrival, self._blocked_until)
+            logging.info(f"Rate limiter backing off for {backoff_seconds:.1f}s, rate now {self.rate:.2f} req/s")
+
+
+# Exponential backoff with jitter for the given retry attempt (1-based): half of the
+# capped exponential delay plus a random share of the other half
+def backoff_delay(attempt, base, cap, rng=random):
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay / 2 + rng.uniform(0, delay / 2)
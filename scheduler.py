@@ -0,0 +1,83 @@
+import logging
+from datetime import datetime
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
+from config import (REFRESH_INTERVAL_MINUTES, REFRESH_MAX_WORKERS, REFRESH_EXECUTOR, REFRESH_MAX_JOBS_PER_APP,
+                    REFRESH_MAX_JOBS_TOTAL, REFRESH_JOB_LEASE_MINUTES)
+from db import get_app_ids, start_refresh_job, finish_refresh_job
+from utils import refresh_reviews, NO_NEW_REVIEWS_MESSAGE
+
+# How often the scheduler checks app_ids for apps that were added or removed
+APP_SYNC_INTERVAL_MINUTES = 5
+
+# Refresh one app as a tracked job, respecting the per-app and global limits on running jobs.
+# Returns the refresh summary and message, like refresh_reviews.
+def run_refresh_job(app_id, incremental=True, trigger='scheduled', update_ui=None):
+    job_id = start_refresh_job(app_id, trigger=trigger, max_per_app=REFRESH_MAX_JOBS_PER_APP,
+                               max_total=REFRESH_MAX_JOBS_TOTAL, lease_minutes=REFRESH_JOB_LEASE_MINUTES)
+    if job_id is None:
+        message = f"A refresh of {app_id} is already running or the refresh limit is reached. Try again later."
+        logging.info(message)
+        if update_ui:
+            update_ui(message)
+        return None, message
+
+    logging.info(f"Started refresh job {job_id} for {app_id} ({trigger}, incremental: {incremental})")
+    try:
+        summary, message = refresh_reviews(app_id, update_ui=update_ui, incremental=incremental, job_id=job_id)
+    except Exception as e:
+        finish_refresh_job(job_id, 'failed', message=str(e))
+        raise
+    if summary is not None:
+        finish_refresh_job(job_id, 'succeeded', summary['fetched'], summary['saved'], message)
+    elif message == NO_NEW_REVIEWS_MESSAGE:
+        finish_refresh_job(job_id, 'succeeded', message=message)
+    else:
+        finish_refresh_job(job_id, 'failed', message=message)
+    return summary, message
+
+# Job id used for an app's periodic refresh
+def _refresh_job_id(app_id):
+    return f"refresh:{app_id}"
+
+# Make sure there is exactly one periodic refresh job per app in app_ids; new apps are refreshed right away
+def sync_app_jobs(scheduler, interval_minutes=REFRESH_INTERVAL_MINUTES, incremental=True):
+    app_ids = set(get_app_ids())
+    scheduled = {job.id for job in scheduler.get_jobs() if job.id.startswith('refresh:')}
+    for app_id in app_ids:
+        if _refresh_job_id(app_id) not in scheduled:
+            scheduler.add_job(run_refresh_job, 'interval', minutes=interval_minutes, args=[app_id],
+                              kwargs={'incremental': incremental}, id=_refresh_job_id(app_id),
+                              max_instances=REFRESH_MAX_JOBS_PER_APP, coalesce=True,
+                              misfire_grace_time=interval_minutes * 60, jitter=60,
+                              next_run_time=datetime.now(scheduler.timezone))
+            logging.info(f"Scheduled refresh of {app_id} every {interval_minutes} minutes")
+    for job_id in scheduled - {_refresh_job_id(app_id) for app_id in app_ids}:
+        scheduler.remove_job(job_id)
+        logging.info(f"Removed scheduled job {job_id}")
+
+# Create a scheduler that refreshes every app in app_ids on an interval with a bounded worker pool
+def create_scheduler(background=True, interval_minutes=REFRESH_INTERVAL_MINUTES, max_workers=REFRESH_MAX_WORKERS,
+                     executor=REFRESH_EXECUTOR, incremental=True):
+    pool = ProcessPoolExecutor(max_workers) if executor == 'process' else ThreadPoolExecutor(max_workers)
+    scheduler_class = BackgroundScheduler if background else BlockingScheduler
+    scheduler = scheduler_class(executors={'default': pool, 'sync': ThreadPoolExecutor(1)})
+    sync_app_jobs(scheduler, interval_minutes, incremental)
+    scheduler.add_job(sync_app_jobs, 'interval', minutes=APP_SYNC_INTERVAL_MINUTES, id='sync-app-jobs',
+                      args=[scheduler, interval_minutes, incremental], executor='sync',
+                      max_instances=1, coalesce=True)
+    return scheduler
+
+# Run the scheduler in the foreground, e.g. `python scheduler.py` in a container
+def main():
+    scheduler = create_scheduler(background=False)
+    logging.info(f"Starting refresh scheduler: every {REFRESH_INTERVAL_MINUTES} minutes, "
+                 f"{REFRESH_MAX_WORKERS} {REFRESH_EXECUTOR} workers")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        logging.info("Refresh scheduler stopped.")
+
+if __name__ == "__main__":
+    main()
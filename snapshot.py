@@ -0,0 +1,71 @@
+import os
+import logging
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from config import SNAPSHOT_DIR, REVIEW_FRAME_PYARROW_STRINGS
+
+# Typed columns of a review snapshot
+SNAPSHOT_SCHEMA = pa.schema([
+    ('app_id', pa.dictionary(pa.int32(), pa.string())),
+    ('review_id', pa.string()),
+    ('username', pa.string()),
+    ('date', pa.timestamp('s')),
+    ('rating', pa.int8()),
+    ('review_text', pa.string()),
+    ('sentiment', pa.dictionary(pa.int8(), pa.string())),
+    ('sentiment_score', pa.float32()),
+    ('tags', pa.dictionary(pa.int32(), pa.string())),
+])
+
+# Strings stay in the memory-mapped Arrow buffers instead of being copied into Python objects
+_PANDAS_TYPES = {pa.string(): pd.StringDtype('pyarrow')}.get if REVIEW_FRAME_PYARROW_STRINGS else None
+
+# Path of an app's snapshot file
+def snapshot_path(app_id, snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, f"{app_id}.arrow")
+
+# Data version an app's snapshot was written at, or None without a snapshot (reads only the schema)
+def snapshot_version(app_id, snapshot_dir=SNAPSHOT_DIR):
+    path = snapshot_path(app_id, snapshot_dir)
+    if not os.path.exists(path):
+        return None
+    return int(pa.ipc.open_file(pa.memory_map(path, 'r')).schema.metadata[b'data_version'])
+
+# Write an app's reviews as an uncompressed Arrow IPC file (so it can be memory-mapped), tagged with
+# the data version it was read at. The file is replaced atomically.
+def write_snapshot(app_id, reviews_df, data_version, snapshot_dir=SNAPSHOT_DIR):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    reviews_df = reviews_df.copy()
+    reviews_df['date'] = pd.to_datetime(reviews_df['date'])
+    reviews_df['rating'] = reviews_df['rating'].fillna(0)
+    table = pa.Table.from_pandas(reviews_df[SNAPSHOT_SCHEMA.names], schema=SNAPSHOT_SCHEMA, preserve_index=False)
+    table = table.replace_schema_metadata({'app_id': app_id, 'data_version': str(data_version)})
+    fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, suffix='.arrow.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, snapshot_path(app_id, snapshot_dir))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    logging.info(f"Wrote review snapshot for {app_id}: {table.num_rows} rows at data version {data_version}")
+    return table.num_rows
+
+# Memory-map an app's snapshot and return its reviews within the date range (end date inclusive),
+# or None when there is no snapshot or it was written at another data version than data_version
+def read_snapshot(app_id, data_version, start_date=None, end_date=None, snapshot_dir=SNAPSHOT_DIR):
+    path = snapshot_path(app_id, snapshot_dir)
+    if not os.path.exists(path):
+        return None
+    reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+    if int(reader.schema.metadata[b'data_version']) != data_version:
+        logging.info(f"Review snapshot for {app_id} is stale")
+        return None
+    table = reader.read_all()
+    if start_date and end_date:
+        start = pa.scalar(pd.Timestamp(start_date), type=pa.timestamp('s'))
+        end = pa.scalar(pd.Timestamp(end_date) + pd.Timedelta(days=1), type=pa.timestamp('s'))
+        table = table.filter(pc.and_(pc.greater_equal(table['date'], start), pc.less(table['date'], end)))
+    return table.to_pandas(split_blocks=True, types_mapper=_PANDAS_TYPES, coerce_temporal_nanoseconds=True)
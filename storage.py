@@ -0,0 +1,948 @@
+import re
+import logging
+import sqlite3
+import warnings
+from config import (STORAGE_BACKEND, DB_PATH, SQLITE_POOL_SIZE, SQLITE_BUSY_TIMEOUT, SQLITE_PRAGMAS, POSTGRES_DSN,
+                    POSTGRES_POOL_SIZE, POSTGRES_BATCH_SIZE)
+
+# Storage backends behind db.py. A backend opens connections (autocommit, with transactions started
+# explicitly by db.transaction()), creates the schema with everything that keeps the daily rollups,
+# data versions and search index up to date, and provides the few SQL fragments that differ between
+# databases. Everything else in db.py is written in SQL that SQLite and PostgreSQL both accept, with
+# ? placeholders.
+
+# Add a review to the day rollup (used inside triggers with NEW/OLD as row)
+def _review_rollup_upsert(row, sign):
+    return f'''
+        INSERT INTO daily_review_stats (app_id, day, reviews, rating_sum, positive, negative, neutral)
+        SELECT {row}.app_id, substr({row}.date, 1, 10), {sign}, {sign} * COALESCE({row}.rating, 0),
+               {sign} * ({row}.sentiment IS 'Positive'), {sign} * ({row}.sentiment IS 'Negative'),
+               {sign} * ({row}.sentiment IS 'Neutral')
+        WHERE {row}.date IS NOT NULL
+        ON CONFLICT (app_id, day) DO UPDATE SET
+            reviews = reviews + excluded.reviews,
+            rating_sum = rating_sum + excluded.rating_sum,
+            positive = positive + excluded.positive,
+            negative = negative + excluded.negative,
+            neutral = neutral + excluded.neutral;
+    '''
+
+# Add or remove a review's tags from the tag rollup of a day (used inside triggers)
+def _tag_rollup_upsert(app_id, day, tags, sign):
+    return f'''
+        INSERT INTO daily_tag_stats (app_id, day, tag, reviews)
+        SELECT {app_id}, {day}, tag, {sign} FROM ({tags}) WHERE {day} IS NOT NULL
+        ON CONFLICT (app_id, day, tag) DO UPDATE SET reviews = reviews + excluded.reviews;
+    '''
+
+_ROLLUP_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_rollup_insert AFTER INSERT ON reviews BEGIN
+        {_review_rollup_upsert('NEW', 1)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_rollup_delete AFTER DELETE ON reviews BEGIN
+        {_review_rollup_upsert('OLD', -1)}
+        DELETE FROM daily_review_stats WHERE app_id = OLD.app_id AND day = substr(OLD.date, 1, 10) AND reviews <= 0;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_rollup_update AFTER UPDATE OF app_id, date, rating, sentiment ON reviews
+    WHEN OLD.app_id IS NOT NEW.app_id OR OLD.date IS NOT NEW.date OR OLD.rating IS NOT NEW.rating
+         OR OLD.sentiment IS NOT NEW.sentiment
+    BEGIN
+        {_review_rollup_upsert('OLD', -1)}
+        {_review_rollup_upsert('NEW', 1)}
+        DELETE FROM daily_review_stats WHERE app_id = OLD.app_id AND day = substr(OLD.date, 1, 10) AND reviews <= 0;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_rollup_move_tags AFTER UPDATE OF app_id, date ON reviews
+    WHEN OLD.app_id IS NOT NEW.app_id OR substr(OLD.date, 1, 10) IS NOT substr(NEW.date, 1, 10)
+    BEGIN
+        {_tag_rollup_upsert('OLD.app_id', 'substr(OLD.date, 1, 10)',
+                            'SELECT tag FROM review_tags WHERE review_id = NEW.review_id', -1)}
+        {_tag_rollup_upsert('NEW.app_id', 'substr(NEW.date, 1, 10)',
+                            'SELECT tag FROM review_tags WHERE review_id = NEW.review_id', 1)}
+        DELETE FROM daily_tag_stats WHERE app_id = OLD.app_id AND day = substr(OLD.date, 1, 10) AND reviews <= 0;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS review_tags_rollup_insert AFTER INSERT ON review_tags BEGIN
+        {_tag_rollup_upsert('NEW.app_id', '(SELECT substr(date, 1, 10) FROM reviews WHERE review_id = NEW.review_id)',
+                            'SELECT NEW.tag AS tag', 1)}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS review_tags_rollup_delete AFTER DELETE ON review_tags BEGIN
+        {_tag_rollup_upsert('OLD.app_id', '(SELECT substr(date, 1, 10) FROM reviews WHERE review_id = OLD.review_id)',
+                            'SELECT OLD.tag AS tag', -1)}
+        DELETE FROM daily_tag_stats WHERE app_id = OLD.app_id AND tag = OLD.tag AND reviews <= 0;
+    END
+    ''',
+]
+
+# Triggers keeping an external-content FTS5 table over reviews.review_text in sync with reviews
+def _search_index_triggers(index):
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON reviews BEGIN
+            INSERT INTO {index} (rowid, review_text) VALUES (NEW.rowid, NEW.review_text);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON reviews BEGIN
+            INSERT INTO {index} ({index}, rowid, review_text) VALUES ('delete', OLD.rowid, OLD.review_text);
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF review_text ON reviews
+        WHEN OLD.review_text IS NOT NEW.review_text
+        BEGIN
+            INSERT INTO {index} ({index}, rowid, review_text) VALUES ('delete', OLD.rowid, OLD.review_text);
+            INSERT INTO {index} (rowid, review_text) VALUES (NEW.rowid, NEW.review_text);
+        END
+        ''',
+    ]
+
+_SEARCH_INDEX_TRIGGERS = _search_index_triggers('reviews_fts')
+
+# Substring index for tag rule keywords; the FTS5 trigram tokenizer needs SQLite 3.34
+_TRIGRAM_INDEX = sqlite3.sqlite_version_info >= (3, 34, 0)
+_TRIGRAM_INDEX_TRIGGERS = _search_index_triggers('reviews_trigram')
+
+# Bump an app's data version, or another per-app version table (used inside triggers)
+def _bump_data_version(app_id, table='data_versions'):
+    return f'''
+        INSERT INTO {table} (app_id, version) VALUES ({app_id}, 1)
+        ON CONFLICT (app_id) DO UPDATE SET version = version + 1;
+    '''
+
+_DATA_VERSION_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_version_insert AFTER INSERT ON reviews BEGIN
+        {_bump_data_version('NEW.app_id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_version_delete AFTER DELETE ON reviews BEGIN
+        {_bump_data_version('OLD.app_id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS reviews_version_update AFTER UPDATE ON reviews
+    WHEN OLD.app_id IS NOT NEW.app_id OR OLD.username IS NOT NEW.username OR OLD.date IS NOT NEW.date
+         OR OLD.rating IS NOT NEW.rating OR OLD.review_text IS NOT NEW.review_text
+         OR OLD.sentiment IS NOT NEW.sentiment OR OLD.sentiment_score IS NOT NEW.sentiment_score
+    BEGIN
+        {_bump_data_version('OLD.app_id')}
+        {_bump_data_version('NEW.app_id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS review_tags_version_insert AFTER INSERT ON review_tags BEGIN
+        {_bump_data_version('NEW.app_id')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS review_tags_version_delete AFTER DELETE ON review_tags BEGIN
+        {_bump_data_version('OLD.app_id')}
+    END
+    ''',
+]
+
+# Per-app tag rule versions, so every process (app, scheduler, CLI) notices rule changes and
+# recompiles its keyword matcher
+_TAG_RULE_VERSION_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tag_rules_version_insert AFTER INSERT ON tag_rules BEGIN
+        {_bump_data_version('NEW.app_id', 'tag_rule_versions')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tag_rules_version_delete AFTER DELETE ON tag_rules BEGIN
+        {_bump_data_version('OLD.app_id', 'tag_rule_versions')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS tag_rules_version_update AFTER UPDATE ON tag_rules BEGIN
+        {_bump_data_version('OLD.app_id', 'tag_rule_versions')}
+        {_bump_data_version('NEW.app_id', 'tag_rule_versions')}
+    END
+    ''',
+]
+
+# Recompute the daily rollups from the reviews and review_tags tables
+def rebuild_rollups(cursor):
+    cursor.execute("DELETE FROM daily_review_stats")
+    cursor.execute("DELETE FROM daily_tag_stats")
+    cursor.execute('''
+        INSERT INTO daily_review_stats (app_id, day, reviews, rating_sum, positive, negative, neutral)
+        SELECT app_id, substr(date, 1, 10), COUNT(*), SUM(COALESCE(rating, 0)),
+               COUNT(*) FILTER (WHERE sentiment = 'Positive'), COUNT(*) FILTER (WHERE sentiment = 'Negative'),
+               COUNT(*) FILTER (WHERE sentiment = 'Neutral')
+        FROM reviews WHERE date IS NOT NULL GROUP BY app_id, substr(date, 1, 10)
+    ''')
+    cursor.execute('''
+        INSERT INTO daily_tag_stats (app_id, day, tag, reviews)
+        SELECT t.app_id, substr(r.date, 1, 10), t.tag, COUNT(*)
+        FROM review_tags t JOIN reviews r ON r.review_id = t.review_id
+        WHERE r.date IS NOT NULL GROUP BY t.app_id, substr(r.date, 1, 10), t.tag
+    ''')
+
+# Turn a search box query into an FTS5 query: "quoted phrases" are kept, other words are quoted
+# so punctuation can't break the syntax, and a trailing * keeps prefix matching (all terms must match)
+def _fts_query(text):
+    terms = []
+    for index, part in enumerate(text.split('"')):
+        if index % 2:
+            if part.strip():
+                terms.append('"' + part.strip() + '"')
+            continue
+        for word in part.split():
+            prefix = word.endswith('*')
+            word = word.rstrip('*').replace('"', '')
+            if word:
+                terms.append('"' + word + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+# Unicode-aware lower() for SQLite, whose built-in lower() only folds ASCII letters
+def _unicode_lower(text):
+    return text.lower() if isinstance(text, str) else text
+
+
+# SQLite database file in WAL mode with tuned pragmas; the full-text index is an FTS5 table and
+# rollups and data versions are maintained by row triggers
+class SQLiteBackend:
+    name = 'sqlite'
+    begin_write = "BEGIN IMMEDIATE"
+    begin_read = "BEGIN"
+    pool_size = SQLITE_POOL_SIZE
+
+    def __init__(self, db_path=DB_PATH, pragmas=SQLITE_PRAGMAS):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.location = db_path
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        conn.create_function('unicode_lower', 1, _unicode_lower, deterministic=True)
+        return conn
+
+    # Comma-separated aggregate of a text expression
+    def group_concat(self, expression):
+        return f"GROUP_CONCAT({expression})"
+
+    # Lowercase a text expression the way Python's str.lower() does
+    def lower(self, expression):
+        return f"unicode_lower({expression})"
+
+    # Run an INSERT and return the generated key of the new row (RETURNING needs SQLite 3.35)
+    def insert_returning_id(self, cursor, query, params, key):
+        cursor.execute(query, params)
+        return cursor.lastrowid
+
+    # Serialize refresh job leases until the end of the transaction; BEGIN IMMEDIATE already does
+    def lock_refresh_jobs(self, cursor):
+        pass
+
+    # SQL pieces of a full-text search for the search box text, or None when it has no terms
+    def search_clauses(self, text):
+        query = _fts_query(text)
+        if not query:
+            return None
+        # CROSS JOIN keeps the index as the outer loop; with a plain JOIN SQLite scans the app's
+        # reviews and runs the MATCH once per review
+        return {'query': query,
+                'from': "reviews_fts CROSS JOIN reviews r ON r.rowid = reviews_fts.rowid",
+                'match': "reviews_fts MATCH ?",
+                'snippet': "snippet(reviews_fts, 0, '**', '**', '…', 16)",
+                'rank': "reviews_fts.rank"}
+
+    def rebuild_search_index(self, conn):
+        conn.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')")
+        if _TRIGRAM_INDEX:
+            conn.execute("INSERT INTO reviews_trigram (reviews_trigram) VALUES ('rebuild')")
+
+    # IDs of an app's reviews containing a keyword as whole words (as a phrase, ignoring case and
+    # word endings), looked up in the search index; None when the index can't answer for the keyword
+    def find_keyword_candidates(self, cursor, app_id, keyword):
+        if not re.search(r'\w', keyword):
+            return None
+        cursor.execute("SELECT r.review_id FROM reviews_fts CROSS JOIN reviews r ON r.rowid = reviews_fts.rowid "
+                       "WHERE reviews_fts MATCH ? AND r.app_id = ?", (_fts_query(f'"{keyword}"'), app_id))
+        return {row[0] for row in cursor.fetchall()}
+
+    # IDs of an app's reviews containing a keyword anywhere in their text, ignoring case, looked up in
+    # the trigram index; None for keywords under 3 characters, which have no trigrams to look up
+    def find_substring_candidates(self, cursor, app_id, keyword):
+        if not _TRIGRAM_INDEX or len(keyword) < 3:
+            return None
+        cursor.execute("SELECT r.review_id FROM reviews_trigram CROSS JOIN reviews r ON r.rowid = reviews_trigram.rowid "
+                       "WHERE reviews_trigram MATCH ? AND r.app_id = ?", ('"' + keyword.replace('"', '""') + '"', app_id))
+        return {row[0] for row in cursor.fetchall()}
+
+    # Create tables, indexes and triggers, migrating older schemas
+    def create_schema(self, cursor):
+        # Reviews table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reviews (
+                app_id TEXT,
+                review_id TEXT PRIMARY KEY,
+                username TEXT,
+                date TEXT,
+                rating INTEGER,
+                review_text TEXT,
+                sentiment TEXT,
+                sentiment_score FLOAT,
+                tags TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_app_id ON reviews (app_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_reviews_app_date ON reviews (app_id, date, review_id)')
+
+        # App IDs table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS app_ids (
+                app_id TEXT PRIMARY KEY
+            )
+        ''')
+
+        # Tag rules table
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='tag_rules'")
+        if cursor.fetchone():
+            cursor.execute("PRAGMA table_info(tag_rules)")
+            columns = [info[1] for info in cursor.fetchall()]
+            if 'app_id' not in columns:
+                logging.info("Migrating tag_rules table to include app_id column.")
+                cursor.execute("ALTER TABLE tag_rules RENAME TO tag_rules_old")
+                cursor.execute('''
+                    CREATE TABLE tag_rules (
+                        app_id TEXT,
+                        tag_name TEXT,
+                        keywords TEXT,
+                        PRIMARY KEY (app_id, tag_name)
+                    )
+                ''')
+                cursor.execute("INSERT INTO tag_rules (app_id, tag_name, keywords) SELECT 'cashgiraffe.app', tag_name, keywords FROM tag_rules_old")
+                cursor.execute("DROP TABLE tag_rules_old")
+                logging.info("tag_rules table migration completed.")
+        else:
+            cursor.execute('''
+                CREATE TABLE tag_rules (
+                    app_id TEXT,
+                    tag_name TEXT,
+                    keywords TEXT,
+                    PRIMARY KEY (app_id, tag_name)
+                )
+            ''')
+
+        # Extracted tags table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS extracted_tags (
+                app_id TEXT,
+                tag_name TEXT,
+                PRIMARY KEY (app_id, tag_name)
+            )
+        ''')
+
+        # Review tags table (one row per tag on a review), migrated from the legacy reviews.tags CSV column
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='review_tags'")
+        review_tags_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS review_tags (
+                app_id TEXT,
+                review_id TEXT,
+                tag TEXT,
+                PRIMARY KEY (review_id, tag)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_review_tags_app_tag ON review_tags (app_id, tag)')
+        if not review_tags_exists:
+            logging.info("Migrating reviews.tags into the review_tags table.")
+            cursor.execute("SELECT app_id, review_id, tags FROM reviews WHERE tags IS NOT NULL AND tags != ''")
+            migrated_tags = [(app_id, review_id, tag.strip())
+                             for app_id, review_id, tags in cursor.fetchall()
+                             for tag in tags.split(',') if tag.strip()]
+            cursor.executemany("INSERT OR IGNORE INTO review_tags (app_id, review_id, tag) VALUES (?, ?, ?)",
+                               migrated_tags)
+            cursor.execute("UPDATE reviews SET tags = NULL WHERE tags IS NOT NULL")
+            logging.info(f"review_tags migration completed ({len(migrated_tags)} tags).")
+
+        # Fetch state table (per-app high-water mark for incremental refresh)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fetch_state (
+                app_id TEXT PRIMARY KEY,
+                last_review_id TEXT,
+                last_review_at TEXT
+            )
+        ''')
+
+        # Continuation token and progress of an interrupted refresh, so the next refresh can resume it
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fetch_checkpoints (
+                app_id TEXT,
+                mode TEXT,
+                continuation_token TEXT,
+                pages INTEGER,
+                reviews INTEGER,
+                newest_review_id TEXT,
+                newest_review_at TEXT,
+                stop_at_review_id TEXT,
+                stop_at_date TEXT,
+                updated_at TEXT,
+                PRIMARY KEY (app_id, mode)
+            )
+        ''')
+
+        # Reviews seen by an in-progress full refresh, used to prune reviews removed upstream
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS refresh_seen (
+                app_id TEXT,
+                review_id TEXT,
+                PRIMARY KEY (app_id, review_id)
+            )
+        ''')
+
+        # Refresh job history; running jobs also act as per-app and global concurrency leases
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS refresh_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                app_id TEXT,
+                trigger TEXT,
+                status TEXT,
+                started_at TEXT,
+                finished_at TEXT,
+                fetched INTEGER,
+                saved INTEGER,
+                message TEXT,
+                heartbeat_at TEXT
+            )
+        ''')
+        cursor.execute("PRAGMA table_info(refresh_jobs)")
+        if 'heartbeat_at' not in [info[1] for info in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE refresh_jobs ADD COLUMN heartbeat_at TEXT")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_refresh_jobs_status ON refresh_jobs (status, app_id)')
+
+        # Analysis results per normalized review text and analyzer version, least recently used evicted first
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                text_hash TEXT PRIMARY KEY,
+                sentiment TEXT,
+                sentiment_score FLOAT,
+                tags TEXT,
+                last_used TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used)')
+
+        # Full-text index over review_text, stored as an external-content FTS5 table keyed by the
+        # reviews rowid and kept in sync by triggers
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reviews_fts'")
+        search_index_exists = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5 (
+                review_text, content='reviews', content_rowid='rowid', tokenize='porter unicode61'
+            )
+        ''')
+        for statement in _SEARCH_INDEX_TRIGGERS:
+            cursor.execute(statement)
+        if not search_index_exists:
+            logging.info("Building the review search index.")
+            cursor.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')")
+
+        # Trigram index over review_text, so tag rule keywords matched as substrings are looked up
+        # instead of running unicode_lower() LIKE over every review of the app
+        if _TRIGRAM_INDEX:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reviews_trigram'")
+            trigram_index_exists = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS reviews_trigram USING fts5 (
+                    review_text, content='reviews', content_rowid='rowid', tokenize='trigram'
+                )
+            ''')
+            for statement in _TRIGRAM_INDEX_TRIGGERS:
+                cursor.execute(statement)
+            if not trigram_index_exists:
+                logging.info("Building the review trigram index.")
+                cursor.execute("INSERT INTO reviews_trigram (reviews_trigram) VALUES ('rebuild')")
+
+        # Daily rollups of reviews and tags per app, kept up to date by triggers on every write
+        # to reviews and review_tags so the dashboards never have to scan all reviews
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='daily_review_stats'")
+        rollups_exist = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_review_stats (
+                app_id TEXT,
+                day TEXT,
+                reviews INTEGER,
+                rating_sum INTEGER,
+                positive INTEGER,
+                negative INTEGER,
+                neutral INTEGER,
+                PRIMARY KEY (app_id, day)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_tag_stats (
+                app_id TEXT,
+                day TEXT,
+                tag TEXT,
+                reviews INTEGER,
+                PRIMARY KEY (app_id, day, tag)
+            )
+        ''')
+        for statement in _ROLLUP_TRIGGERS:
+            cursor.execute(statement)
+        if not rollups_exist:
+            logging.info("Building daily rollups from stored reviews.")
+            rebuild_rollups(cursor)
+
+        # Per-app data version, bumped by triggers on every change to an app's reviews or tags;
+        # snapshots record the version they were built from so stale ones are detected
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                app_id TEXT PRIMARY KEY,
+                version INTEGER
+            )
+        ''')
+        for statement in _DATA_VERSION_TRIGGERS:
+            cursor.execute(statement)
+
+        # Per-app tag rule version, bumped by triggers on every change to an app's tag rules
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tag_rule_versions (
+                app_id TEXT PRIMARY KEY,
+                version INTEGER
+            )
+        ''')
+        for statement in _TAG_RULE_VERSION_TRIGGERS:
+            cursor.execute(statement)
+
+
+# Turn a search box query into a tsquery: words must all match, "quoted phrases" match as phrases
+# and a trailing * matches prefixes. Only word characters are kept, so the syntax can't break.
+def _tsquery(text):
+    terms = []
+    for index, part in enumerate(text.split('"')):
+        if index % 2:
+            words = re.findall(r'\w+', part)
+            if words:
+                terms.append('(' + ' <-> '.join(words) + ')')
+            continue
+        for word in part.split():
+            words = re.findall(r'\w+', word)
+            if words:
+                if word.endswith('*'):
+                    words[-1] += ':*'
+                terms.append('(' + ' <-> '.join(words) + ')')
+    return ' & '.join(terms)
+
+# Text search document of a review, as indexed by idx_reviews_search
+_SEARCH_DOCUMENT = "to_tsvector('english', COALESCE(r.review_text, ''))"
+
+# Add (sign 1) or remove (sign -1) the reviews of a relation from the day rollup
+def _pg_review_rollup(relation, sign):
+    return f'''
+        INSERT INTO daily_review_stats AS s (app_id, day, reviews, rating_sum, positive, negative, neutral)
+        SELECT app_id, substr(date, 1, 10), {sign} * COUNT(*), {sign} * SUM(COALESCE(rating, 0)),
+               {sign} * COUNT(*) FILTER (WHERE sentiment = 'Positive'),
+               {sign} * COUNT(*) FILTER (WHERE sentiment = 'Negative'),
+               {sign} * COUNT(*) FILTER (WHERE sentiment = 'Neutral')
+        FROM {relation} WHERE date IS NOT NULL GROUP BY app_id, substr(date, 1, 10)
+        ON CONFLICT (app_id, day) DO UPDATE SET
+            reviews = s.reviews + EXCLUDED.reviews,
+            rating_sum = s.rating_sum + EXCLUDED.rating_sum,
+            positive = s.positive + EXCLUDED.positive,
+            negative = s.negative + EXCLUDED.negative,
+            neutral = s.neutral + EXCLUDED.neutral;
+    '''
+
+# Add or remove tags of a relation of (app_id, day, tag) rows from the tag rollup
+def _pg_tag_rollup(relation, sign):
+    return f'''
+        INSERT INTO daily_tag_stats AS s (app_id, day, tag, reviews)
+        SELECT app_id, day, tag, {sign} * COUNT(*) FROM ({relation}) tags WHERE day IS NOT NULL
+        GROUP BY app_id, day, tag
+        ON CONFLICT (app_id, day, tag) DO UPDATE SET reviews = s.reviews + EXCLUDED.reviews;
+    '''
+
+# Bump the data version (or another per-app version) of every app in a relation once
+def _pg_bump_data_versions(relation, table='data_versions'):
+    return f'''
+        INSERT INTO {table} AS v (app_id, version) SELECT app_id, 1 FROM ({relation}) apps GROUP BY app_id
+        ON CONFLICT (app_id) DO UPDATE SET version = v.version + 1;
+    '''
+
+# Old (side o) or new (side n) versions of the reviews of an UPDATE statement whose rollup columns changed
+_CHANGED_ROLLUP_ROWS = '''
+    (SELECT {side}.* FROM old_rows o JOIN new_rows n ON n.review_id = o.review_id
+     WHERE (o.app_id, o.date, o.rating, o.sentiment) IS DISTINCT FROM (n.app_id, n.date, n.rating, n.sentiment)) changed
+'''
+
+# Reviews of an UPDATE statement with their old and new app and date
+_CHANGED_REVIEWS = '''
+    SELECT o.app_id AS old_app_id, o.date AS old_date, n.app_id AS new_app_id, n.date AS new_date, n.review_id
+    FROM old_rows o JOIN new_rows n ON n.review_id = o.review_id
+'''
+
+# Apps of an UPDATE statement's reviews that actually changed (both apps when a review moved)
+_UPDATED_REVIEW_APPS = '''
+    SELECT o.app_id FROM old_rows o JOIN new_rows n ON n.review_id = o.review_id
+    WHERE (o.app_id, o.username, o.date, o.rating, o.review_text, o.sentiment, o.sentiment_score)
+          IS DISTINCT FROM (n.app_id, n.username, n.date, n.rating, n.review_text, n.sentiment, n.sentiment_score)
+    UNION ALL
+    SELECT n.app_id FROM old_rows o JOIN new_rows n ON n.review_id = o.review_id
+    WHERE o.app_id IS DISTINCT FROM n.app_id
+'''
+
+# Statement-level triggers over transition tables, so a bulk upsert updates each rollup row and
+# data version once per statement instead of once per review
+_PG_TRIGGER_FUNCTIONS = {
+    'reviews_inserted': f'''
+        {_pg_review_rollup('new_rows', 1)}
+        {_pg_bump_data_versions('SELECT app_id FROM new_rows')}
+    ''',
+    'reviews_deleted': f'''
+        {_pg_review_rollup('old_rows', -1)}
+        DELETE FROM daily_review_stats WHERE reviews <= 0
+            AND (app_id, day) IN (SELECT app_id, substr(date, 1, 10) FROM old_rows);
+        {_pg_bump_data_versions('SELECT app_id FROM old_rows')}
+    ''',
+    'reviews_updated': f'''
+        {_pg_review_rollup(_CHANGED_ROLLUP_ROWS.format(side='o'), -1)}
+        {_pg_review_rollup(_CHANGED_ROLLUP_ROWS.format(side='n'), 1)}
+        DELETE FROM daily_review_stats WHERE reviews <= 0
+            AND (app_id, day) IN (SELECT app_id, substr(date, 1, 10) FROM old_rows);
+        {_pg_tag_rollup(f"""SELECT c.old_app_id AS app_id, substr(c.old_date, 1, 10) AS day, t.tag
+                            FROM ({_CHANGED_REVIEWS}) c JOIN review_tags t ON t.review_id = c.review_id
+                            WHERE c.old_app_id IS DISTINCT FROM c.new_app_id
+                               OR substr(c.old_date, 1, 10) IS DISTINCT FROM substr(c.new_date, 1, 10)""", -1)}
+        {_pg_tag_rollup(f"""SELECT c.new_app_id AS app_id, substr(c.new_date, 1, 10) AS day, t.tag
+                            FROM ({_CHANGED_REVIEWS}) c JOIN review_tags t ON t.review_id = c.review_id
+                            WHERE c.old_app_id IS DISTINCT FROM c.new_app_id
+                               OR substr(c.old_date, 1, 10) IS DISTINCT FROM substr(c.new_date, 1, 10)""", 1)}
+        DELETE FROM daily_tag_stats WHERE reviews <= 0
+            AND (app_id, day) IN (SELECT app_id, substr(date, 1, 10) FROM old_rows);
+        {_pg_bump_data_versions(_UPDATED_REVIEW_APPS)}
+    ''',
+    'review_tags_inserted': f'''
+        {_pg_tag_rollup("""SELECT t.app_id, substr(r.date, 1, 10) AS day, t.tag
+                           FROM new_rows t JOIN reviews r ON r.review_id = t.review_id""", 1)}
+        {_pg_bump_data_versions('SELECT app_id FROM new_rows')}
+    ''',
+    'review_tags_deleted': f'''
+        {_pg_tag_rollup("""SELECT t.app_id, substr(r.date, 1, 10) AS day, t.tag
+                           FROM old_rows t JOIN reviews r ON r.review_id = t.review_id""", -1)}
+        DELETE FROM daily_tag_stats WHERE reviews <= 0 AND (app_id, tag) IN (SELECT app_id, tag FROM old_rows);
+        {_pg_bump_data_versions('SELECT app_id FROM old_rows')}
+    ''',
+    'tag_rules_inserted': f'''
+        {_pg_bump_data_versions('SELECT app_id FROM new_rows', 'tag_rule_versions')}
+    ''',
+    'tag_rules_deleted': f'''
+        {_pg_bump_data_versions('SELECT app_id FROM old_rows', 'tag_rule_versions')}
+    ''',
+    'tag_rules_updated': f'''
+        {_pg_bump_data_versions('SELECT app_id FROM old_rows UNION SELECT app_id FROM new_rows', 'tag_rule_versions')}
+    ''',
+}
+
+# (trigger name, table, event, transition tables, function) of the PostgreSQL triggers
+_PG_TRIGGERS = [
+    ('reviews_insert', 'reviews', 'INSERT', 'NEW TABLE AS new_rows', 'reviews_inserted'),
+    ('reviews_delete', 'reviews', 'DELETE', 'OLD TABLE AS old_rows', 'reviews_deleted'),
+    ('reviews_update', 'reviews', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows', 'reviews_updated'),
+    ('review_tags_insert', 'review_tags', 'INSERT', 'NEW TABLE AS new_rows', 'review_tags_inserted'),
+    ('review_tags_delete', 'review_tags', 'DELETE', 'OLD TABLE AS old_rows', 'review_tags_deleted'),
+    ('tag_rules_insert', 'tag_rules', 'INSERT', 'NEW TABLE AS new_rows', 'tag_rules_inserted'),
+    ('tag_rules_delete', 'tag_rules', 'DELETE', 'OLD TABLE AS old_rows', 'tag_rules_deleted'),
+    ('tag_rules_update', 'tag_rules', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows', 'tag_rules_updated'),
+]
+
+# PostgreSQL tables and indexes, matching the SQLite schema
+POSTGRES_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS reviews (
+        app_id TEXT,
+        review_id TEXT PRIMARY KEY,
+        username TEXT,
+        date TEXT,
+        rating INTEGER,
+        review_text TEXT,
+        sentiment TEXT,
+        sentiment_score FLOAT,
+        tags TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_reviews_app_date ON reviews (app_id, date, review_id)',
+    f"CREATE INDEX IF NOT EXISTS idx_reviews_search ON reviews USING GIN ({_SEARCH_DOCUMENT.replace('r.', '')})",
+    'CREATE TABLE IF NOT EXISTS app_ids (app_id TEXT PRIMARY KEY)',
+    'CREATE TABLE IF NOT EXISTS tag_rules (app_id TEXT, tag_name TEXT, keywords TEXT, PRIMARY KEY (app_id, tag_name))',
+    'CREATE TABLE IF NOT EXISTS extracted_tags (app_id TEXT, tag_name TEXT, PRIMARY KEY (app_id, tag_name))',
+    'CREATE TABLE IF NOT EXISTS review_tags (app_id TEXT, review_id TEXT, tag TEXT, PRIMARY KEY (review_id, tag))',
+    'CREATE INDEX IF NOT EXISTS idx_review_tags_app_tag ON review_tags (app_id, tag)',
+    'CREATE TABLE IF NOT EXISTS fetch_state (app_id TEXT PRIMARY KEY, last_review_id TEXT, last_review_at TEXT)',
+    '''
+    CREATE TABLE IF NOT EXISTS fetch_checkpoints (
+        app_id TEXT,
+        mode TEXT,
+        continuation_token TEXT,
+        pages INTEGER,
+        reviews INTEGER,
+        newest_review_id TEXT,
+        newest_review_at TEXT,
+        stop_at_review_id TEXT,
+        stop_at_date TEXT,
+        updated_at TEXT,
+        PRIMARY KEY (app_id, mode)
+    )
+    ''',
+    'CREATE TABLE IF NOT EXISTS refresh_seen (app_id TEXT, review_id TEXT, PRIMARY KEY (app_id, review_id))',
+    '''
+    CREATE TABLE IF NOT EXISTS refresh_jobs (
+        job_id BIGSERIAL PRIMARY KEY,
+        app_id TEXT,
+        trigger TEXT,
+        status TEXT,
+        started_at TEXT,
+        finished_at TEXT,
+        fetched INTEGER,
+        saved INTEGER,
+        message TEXT,
+        heartbeat_at TEXT
+    )
+    ''',
+    'ALTER TABLE refresh_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TEXT',
+    'CREATE INDEX IF NOT EXISTS idx_refresh_jobs_status ON refresh_jobs (status, app_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS analysis_cache (
+        text_hash TEXT PRIMARY KEY,
+        sentiment TEXT,
+        sentiment_score FLOAT,
+        tags TEXT,
+        last_used TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used)',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_review_stats (
+        app_id TEXT,
+        day TEXT,
+        reviews INTEGER,
+        rating_sum INTEGER,
+        positive INTEGER,
+        negative INTEGER,
+        neutral INTEGER,
+        PRIMARY KEY (app_id, day)
+    )
+    ''',
+    'CREATE TABLE IF NOT EXISTS daily_tag_stats (app_id TEXT, day TEXT, tag TEXT, reviews INTEGER, PRIMARY KEY (app_id, day, tag))',
+    'CREATE TABLE IF NOT EXISTS data_versions (app_id TEXT PRIMARY KEY, version INTEGER)',
+    'CREATE TABLE IF NOT EXISTS tag_rule_versions (app_id TEXT PRIMARY KEY, version INTEGER)',
+]
+
+# Lock id that serializes schema creation between processes starting at the same time
+_SCHEMA_LOCK_ID = 7300421
+
+# Lock id that serializes refresh job leases, so the running-job limits are checked and taken atomically
+_REFRESH_JOBS_LOCK_ID = 7300422
+
+# Statements of an executemany whose VALUES list can be sent as one multi-row VALUES per page
+_VALUES_PATTERN = re.compile(r"VALUES\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+# Translate ? placeholders to psycopg2's %s (escaping literal %)
+def _pg_sql(query):
+    return query.replace('%', '%%').replace('?', '%s')
+
+
+# psycopg2 cursor that accepts the ? placeholders used throughout db.py. executemany sends
+# INSERT ... VALUES statements as multi-row VALUES pages (execute_values), so bulk writes are
+# one round trip per page instead of one per row.
+class PostgresCursor:
+    def __init__(self, cursor, batch_size=POSTGRES_BATCH_SIZE):
+        self._cursor = cursor
+        self.batch_size = batch_size
+
+    def execute(self, query, params=()):
+        self._cursor.execute(_pg_sql(query), tuple(params or ()))
+        return self
+
+    def executemany(self, query, rows):
+        from psycopg2.extras import execute_values, execute_batch
+        rows = list(rows)
+        if not rows:
+            return self
+        match = _VALUES_PATTERN.search(query)
+        if match:
+            query = _pg_sql(query[:match.start()] + "VALUES ?" + query[match.end():])
+            execute_values(self._cursor, query, rows, page_size=self.batch_size)
+        else:
+            execute_batch(self._cursor, _pg_sql(query), rows, page_size=self.batch_size)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+# psycopg2 connection in autocommit mode with the parts of the sqlite3 connection API db.py uses
+class PostgresConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return PostgresCursor(self._conn.cursor())
+
+    def execute(self, query, params=()):
+        return self.cursor().execute(query, params)
+
+    def executemany(self, query, rows):
+        return self.cursor().executemany(query, rows)
+
+    @property
+    def in_transaction(self):
+        from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+        return self._conn.info.transaction_status != TRANSACTION_STATUS_IDLE
+
+    def commit(self):
+        if self.in_transaction:
+            self.execute("COMMIT")
+
+    def rollback(self):
+        if self.in_transaction:
+            self.execute("ROLLBACK")
+
+    def close(self):
+        self._conn.close()
+
+
+# PostgreSQL database: readers and writers use separate pooled connections with row-level locking,
+# so refreshes don't block dashboards. Rollups and data versions are maintained by statement-level
+# triggers and full-text search uses a GIN index over to_tsvector('english', review_text).
+class PostgresBackend:
+    name = 'postgresql'
+    begin_write = "BEGIN"
+    begin_read = "BEGIN ISOLATION LEVEL REPEATABLE READ"
+    pool_size = POSTGRES_POOL_SIZE
+
+    def __init__(self, dsn=POSTGRES_DSN):
+        from psycopg2.extensions import parse_dsn
+        self.dsn = dsn
+        params = parse_dsn(dsn)
+        self.location = f"postgresql://{params.get('host', 'localhost')}:{params.get('port', 5432)}/{params.get('dbname', '')}"
+        # db.py passes these connections to pandas, which warns about every non-SQLAlchemy connection
+        warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy', category=UserWarning)
+
+    def connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self.dsn, client_encoding='UTF8')
+        conn.autocommit = True
+        return PostgresConnection(conn)
+
+    def group_concat(self, expression):
+        return f"string_agg({expression}, ',' ORDER BY {expression})"
+
+    def lower(self, expression):
+        return f"lower({expression})"
+
+    def insert_returning_id(self, cursor, query, params, key):
+        cursor.execute(f"{query} RETURNING {key}", params)
+        return cursor.fetchone()[0]
+
+    # Under READ COMMITTED two transactions could both count no running jobs and both insert one
+    def lock_refresh_jobs(self, cursor):
+        cursor.execute("SELECT pg_advisory_xact_lock(?)", (_REFRESH_JOBS_LOCK_ID,))
+
+    def search_clauses(self, text):
+        query = _tsquery(text)
+        if not query:
+            return None
+        return {'query': query,
+                'from': "reviews r CROSS JOIN to_tsquery('english', ?) AS query",
+                'match': f"{_SEARCH_DOCUMENT} @@ query",
+                'snippet': ("ts_headline('english', r.review_text, query, "
+                            "'StartSel=**, StopSel=**, MaxWords=16, MinWords=8, MaxFragments=1')"),
+                'rank': f"-ts_rank({_SEARCH_DOCUMENT}, query)"}
+
+    def rebuild_search_index(self, conn):
+        conn.execute("REINDEX INDEX idx_reviews_search")
+
+    # Keywords made only of stop words give an empty tsquery, which matches nothing; those are left
+    # to the caller's scan
+    def find_keyword_candidates(self, cursor, app_id, keyword):
+        query = _tsquery(f'"{keyword}"')
+        if not query:
+            return None
+        cursor.execute("SELECT numnode(to_tsquery('english', ?))", (query,))
+        if cursor.fetchone()[0] == 0:
+            return None
+        cursor.execute(f"SELECT r.review_id FROM reviews r WHERE r.app_id = ? "
+                       f"AND {_SEARCH_DOCUMENT} @@ to_tsquery('english', ?)", (app_id, query))
+        return {row[0] for row in cursor.fetchall()}
+
+    # Substring keywords are left to the caller's lower(review_text) LIKE scan, which the pg_trgm
+    # index answers when the extension is available
+    def find_substring_candidates(self, cursor, app_id, keyword):
+        return None
+
+    # Create tables, indexes and triggers; rollups are built from existing rows when first created
+    def create_schema(self, cursor):
+        cursor.execute("SELECT pg_advisory_xact_lock(?)", (_SCHEMA_LOCK_ID,))
+        cursor.execute("SELECT to_regclass('daily_review_stats') IS NOT NULL")
+        rollups_exist = cursor.fetchone()[0]
+        for statement in POSTGRES_TABLES:
+            cursor.execute(statement)
+        for function, body in _PG_TRIGGER_FUNCTIONS.items():
+            cursor.execute(f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS $$ "
+                           f"BEGIN {body} RETURN NULL; END $$")
+        for trigger, table, event, transitions, function in _PG_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+            cursor.execute(f"CREATE TRIGGER {trigger} AFTER {event} ON {table} REFERENCING {transitions} "
+                           f"FOR EACH STATEMENT EXECUTE FUNCTION {function}()")
+        # Trigram index for substring matches of tag rule keywords; pg_trgm is a contrib extension,
+        # so without it those matches fall back to a sequential scan
+        cursor.execute("SAVEPOINT trigram_index")
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_reviews_text_trgm ON reviews "
+                           "USING GIN (lower(review_text) gin_trgm_ops)")
+            cursor.execute("RELEASE SAVEPOINT trigram_index")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT trigram_index")
+            logging.warning(f"pg_trgm is not available, substring keyword matches will scan reviews: {e}")
+        if not rollups_exist:
+            logging.info("Building daily rollups from stored reviews.")
+            rebuild_rollups(cursor)
+
+
+# Create the storage backend named in config (STORAGE_BACKEND: 'sqlite' or 'postgresql')
+def create_backend(name=STORAGE_BACKEND):
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name in ('postgresql', 'postgres'):
+        return PostgresBackend()
+    raise ValueError(f"Unknown storage backend: {name!r} (expected 'sqlite' or 'postgresql')")
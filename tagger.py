@@ -1,54 +1,125 @@
 import logging
-import sqlite3
-from config import DB_PATH
-from db import load_tag_rules, add_extracted_tag
-from analyzer import extract_tags_from_review
+import time
+from config import TAG_WRITE_CHUNK_SIZE, ANALYSIS_CACHE_MAX_ENTRIES, TAG_RULE_WORD_BOUNDARIES
+from db import (add_extracted_tags, set_review_tags, set_review_tag, load_review_texts, evict_analysis_cache,
+                load_tag_rules, add_tag_rule, delete_tag_rule, load_extracted_tags, get_review_ids_with_tags,
+                find_reviews_with_keywords, get_cached_analyses, save_cached_analyses)
+from matcher import get_tag_matcher
+from analyzer import analyze_reviews
+from progress import ProgressEvent
+from metrics import span, observe
 
 
-# Auto-tag reviews based on current tag rules
-def auto_tag_reviews(app_id):
+# Auto-tag reviews based on current tag rules, writing results in chunked transactions
+def auto_tag_reviews(app_id, update_ui=None, chunk_size=TAG_WRITE_CHUNK_SIZE):
     try:
-        tag_rules = load_tag_rules(app_id)
-        if not tag_rules:
+        tag_matcher = get_tag_matcher(app_id)
+        if not tag_matcher.tags:
             logging.info("No tag rules found for app_id: %s", app_id)
-            return
-
-        conn = None
-        try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT review_id, review_text FROM reviews WHERE app_id = ?", (app_id,))
-            reviews = cursor.fetchall()
-        except sqlite3.Error as e:
-            logging.error("Error connecting to the database: %s", e)
-            raise
-        finally:
-            if conn:
-                conn.close()
-
-        for review_id, review_text in reviews:
-            try:
-                if review_text:
-                    review_text_lower = review_text.lower()
-                    tags = set()
-                    for tag, keywords in tag_rules.items():
-                        if any(keyword in review_text_lower for keyword in keywords):
-                            tags.add(tag)
-                    extracted = extract_tags_from_review(review_text)
-                    for tag in extracted:
-                        tags.add(tag)
-                        add_extracted_tag(app_id, tag)
-                    new_tags = ','.join(tags) if tags else None
-                    conn = sqlite3.connect(DB_PATH)
-                    cursor = conn.cursor()
-                    cursor.execute("UPDATE reviews SET tags = ? WHERE review_id = ?", (new_tags, review_id))
-                    conn.commit()
-            except sqlite3.Error as e:
-                logging.error(f"Error auto-tagging review {review_id}: {e}")
-            finally:
-                if conn:
-                    conn.close()
-        logging.info("Auto-tagging completed for app_id: %s", app_id)
+            return None
+
+        start_time = time.time()
+        reviews = [(review_id, review_text) for review_id, review_text in load_review_texts(app_id) if review_text]
+
+        message = ProgressEvent(f"Extracting tags from {len(reviews)} reviews...", 'tag_extract',
+                                app_id=app_id, reviews=len(reviews))
+        logging.info(message)
+        if update_ui:
+            update_ui(message)
+        _, _, extracted_by_review = analyze_reviews((review_text for _, review_text in reviews),
+                                                    get_cached_analyses, save_cached_analyses)
+        review_tags = []
+        extracted_tags = set()
+        with span('tag_match', items=len(reviews)):
+            for (review_id, review_text), extracted in zip(reviews, extracted_by_review):
+                tags = tag_matcher.match(review_text)
+                tags.update(extracted)
+                extracted_tags.update(extracted)
+                review_tags.append((review_id, tags))
+
+        add_extracted_tags(app_id, extracted_tags)
+        for start in range(0, len(review_tags), chunk_size):
+            set_review_tags(app_id, review_tags[start:start + chunk_size])
+            done = min(start + chunk_size, len(review_tags))
+            message = ProgressEvent(f"Saved tags for {done}/{len(review_tags)} reviews.", 'tags_saved',
+                                    app_id=app_id, done=done, total=len(review_tags))
+            logging.info(message)
+            if update_ui:
+                update_ui(message)
+
+        evict_analysis_cache(ANALYSIS_CACHE_MAX_ENTRIES)
+
+        elapsed = time.time() - start_time
+        observe('auto_tag', elapsed, len(review_tags))
+        rows_per_sec = len(review_tags) / elapsed if elapsed > 0 else 0.0
+        logging.info("Auto-tagging completed for app_id: %s (%d reviews, %.1f rows/sec)",
+                     app_id, len(review_tags), rows_per_sec)
+        return {'reviews': len(review_tags), 'seconds': elapsed, 'rows_per_sec': rows_per_sec}
     except Exception as e:
         logging.error(f"Error auto-tagging reviews: {e}")
         raise
+
+
+# Keywords of a tag rule as the matcher sees them
+def _normalize_keywords(keywords):
+    return {keyword.strip().lower() for keyword in keywords or [] if keyword.strip()}
+
+# Re-tag only the reviews a change to one tag rule can affect, instead of every review: reviews whose
+# text may contain an added keyword (found through the search index or a scan in SQL) and, when
+# keywords were removed or the rule was deleted, the reviews carrying the tag. Pass old_keywords=[]
+# for a new rule and new_keywords=[] for a deleted one. Only tag_name is added or removed on those
+# reviews; it is kept where the rule matches or where it is also a registered extracted tag found in
+# the review text (extraction results come from the analysis cache). Other tags are left alone.
+def retag_rule_change(app_id, tag_name, old_keywords, new_keywords, update_ui=None, chunk_size=TAG_WRITE_CHUNK_SIZE):
+    try:
+        start_time = time.time()
+        old_keywords, new_keywords = _normalize_keywords(old_keywords), _normalize_keywords(new_keywords)
+        review_ids = set()
+        if new_keywords - old_keywords:
+            review_ids = find_reviews_with_keywords(app_id, new_keywords - old_keywords,
+                                                    whole_words=TAG_RULE_WORD_BOUNDARIES)
+        if old_keywords - new_keywords or not new_keywords:
+            review_ids |= get_review_ids_with_tags(app_id, [tag_name])
+        reviews = [(review_id, review_text) for review_id, review_text in load_review_texts(app_id, review_ids)
+                   if review_text] if review_ids else []
+
+        message = ProgressEvent(f"Re-tagging {len(reviews)} reviews affected by the {tag_name} rule...", 'tag_extract',
+                                app_id=app_id, tag=tag_name, reviews=len(reviews))
+        logging.info(message)
+        if update_ui:
+            update_ui(message)
+        changed = 0
+        if reviews:
+            if tag_name in load_extracted_tags(app_id):
+                _, _, extracted_by_review = analyze_reviews((review_text for _, review_text in reviews),
+                                                            get_cached_analyses, save_cached_analyses)
+            else:
+                extracted_by_review = [()] * len(reviews)
+            tag_matcher = get_tag_matcher(app_id)
+            with span('tag_match', items=len(reviews)):
+                review_tags = [(review_id, tag_name in tag_matcher.match(review_text) or tag_name in extracted)
+                               for (review_id, review_text), extracted in zip(reviews, extracted_by_review)]
+            for start in range(0, len(review_tags), chunk_size):
+                changed += set_review_tag(app_id, tag_name, review_tags[start:start + chunk_size])
+
+        elapsed = time.time() - start_time
+        observe('retag_rule', elapsed, len(reviews))
+        logging.info("Re-tagged %d reviews of %s for the %s rule (%d changed) in %.2f seconds",
+                     len(reviews), app_id, tag_name, changed, elapsed)
+        return {'reviews': len(reviews), 'changed': changed, 'seconds': elapsed}
+    except Exception as e:
+        logging.error(f"Error re-tagging reviews for the {tag_name} rule: {e}")
+        raise
+
+# Add or change a tag rule and re-tag the reviews the change affects
+def save_tag_rule(app_id, tag_name, keywords, update_ui=None):
+    old_keywords = load_tag_rules(app_id).get(tag_name, [])
+    add_tag_rule(app_id, tag_name, keywords)
+    return retag_rule_change(app_id, tag_name, old_keywords, keywords, update_ui)
+
+# Delete a tag rule and re-tag the reviews that carried its tag (which keep it only where it was
+# also extracted from the review text)
+def remove_tag_rule(app_id, tag_name, update_ui=None):
+    old_keywords = load_tag_rules(app_id).get(tag_name, [])
+    delete_tag_rule(app_id, tag_name, remove_from_reviews=False)
+    return retag_rule_change(app_id, tag_name, old_keywords, [], update_ui)
@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fetcher
+from google_play_scraper.exceptions import ExtraHTTPError
+from ratelimit import AdaptiveRateLimiter
+
+
+# Play Store batchexecute response holding one page of reviews and the token of the next page
+def _review_response(review_ids, token):
+    items = [[review_id, ['user', None], 5, None, f"review {review_id}", [1700000000], 0] for review_id in review_ids]
+    page = json.dumps([items, [None, token] if token else None, None])
+    return ")]}'\n\n" + json.dumps([['wrb.fr', 'UsvDTd', page]])
+
+
+# Stand-in for google_play_scraper's HTTP post: serves pages in order, then fails like a throttled request
+class ThrottledPlayStore:
+    def __init__(self, pages, error):
+        self.pages = pages
+        self.error = error
+        self.requests = 0
+
+    def __call__(self, url, data, headers):
+        self.requests += 1
+        if self.requests > len(self.pages):
+            raise self.error
+        review_ids, token = self.pages[self.requests - 1]
+        return _review_response(review_ids, token)
+
+
+class FetchReviewPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.waits = []
+        self.limiter = AdaptiveRateLimiter(1.0, 3, 0.1, 5.0, 0.1, 0.5, clock=lambda: 0.0, sleep=self.waits.append)
+
+    def test_throttled_page_is_retried_and_raised(self):
+        store = ThrottledPlayStore([(['r1', 'r2'], 'page2'), (['r3', 'r4'], 'page3')],
+                                   ExtraHTTPError("App not found. Status code 429 returned."))
+        fetched = []
+        with mock.patch('google_play_scraper.features.reviews.post', store):
+            with self.assertRaises(ExtraHTTPError):
+                for page, _ in fetcher.iter_review_pages('com.example.app', batch_size=2, max_retries=3,
+                                                         rate_limiter=self.limiter):
+                    fetched.append([review['reviewId'] for review in page])
+        self.assertEqual(fetched, [['r1', 'r2'], ['r3', 'r4']])
+        self.assertEqual(store.requests, 5)
+        self.assertLess(self.limiter.rate, 1.0)
+        self.assertGreater(self.limiter._blocked_until, 0)
+
+    def test_fetch_all_reviews_does_not_return_a_partial_list(self):
+        store = ThrottledPlayStore([(['r1', 'r2'], 'page2')], ExtraHTTPError("Status code 429 returned."))
+        with mock.patch('google_play_scraper.features.reviews.post', store):
+            with self.assertRaises(ExtraHTTPError):
+                fetcher.fetch_all_reviews('com.example.app', batch_size=2, max_retries=2, rate_limiter=self.limiter)
+
+    def test_end_of_list(self):
+        store = ThrottledPlayStore([(['r1', 'r2'], 'page2'), (['r3'], None)], AssertionError("request past the end"))
+        with mock.patch('google_play_scraper.features.reviews.post', store):
+            pages = fetcher.iter_review_pages('com.example.app', batch_size=2, rate_limiter=self.limiter)
+            self.assertEqual([review['reviewId'] for review in next(pages)[0]], ['r1', 'r2'])
+            self.assertEqual([review['reviewId'] for review in next(pages)[0]], ['r3'])
+            with self.assertRaises(StopIteration) as stop:
+                next(pages)
+        self.assertIs(stop.exception.value, True)
+        self.assertEqual(store.requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,186 +1,306 @@
 import pandas as pd
 import logging
-from fetcher import fetch_all_reviews
-from analyzer import analyze_sentiment, extract_tags_from_review
-from tagger import auto_tag_reviews
-from db import init_db, get_reviews, clear_reviews_cache, get_app_ids, add_app_id, load_tag_rules, add_extracted_tag
-from config import DB_PATH
-import sqlite3
-
-# Fetch reviews, analyze sentiment, and auto-tag, with UI updates
-def refresh_reviews(app_id='cashgiraffe.app', update_ui=None):
-    try:
-        all_reviews = fetch_all_reviews(app_id, batch_size=100, delay=10, update_ui=update_ui)
+import queue
+import threading
+import time
+from config import (PIPELINE_BATCH_SIZE, PIPELINE_QUEUE_SIZE, FETCH_CHECKPOINT_MAX_AGE_HOURS,
+                    ANALYSIS_CACHE_MAX_ENTRIES)
+from fetcher import iter_review_pages, dump_continuation_token, load_continuation_token
+from analyzer import analyze_reviews
+from progress import ProgressEvent
+from metrics import span, observe
+from matcher import get_tag_matcher
+from db import (add_extracted_tags, get_fetch_state, save_fetch_state, save_reviews, begin_full_refresh,
+                prune_unseen_reviews, transaction, get_fetch_checkpoint, save_fetch_checkpoint,
+                clear_fetch_checkpoint, evict_analysis_cache, renew_refresh_job, get_cached_analyses,
+                save_cached_analyses)
 
-        message = "Finished fetching reviews."
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+# Columns of a cleaned review batch, before sentiment and tags are added
+CLEANED_COLUMNS = ['app_id', 'review_id', 'username', 'date', 'rating', 'review_text']
 
-        if not all_reviews:
-            message = "No new reviews fetched."
-            if update_ui:
-                update_ui(message)
-            return None, message
+# Message returned by refresh_reviews when there was nothing new to fetch
+NO_NEW_REVIEWS_MESSAGE = "No new reviews fetched."
 
-        message = f"Total reviews fetched: {len(all_reviews)}"
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+# Marks the end of a pipeline stage's output
+_STAGE_DONE = object()
 
-        message = f"Sample review data (raw): {all_reviews[0] if all_reviews else 'No data'}"
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+# Return a scraper field as a string, unwrapping {'value': ...} dicts
+def _extract_value(field, default=''):
+    if isinstance(field, dict) and 'value' in field:
+        return str(field['value'])
+    return str(field) if field is not None else default
 
-        cleaned_reviews = []
-        for review in all_reviews:
+# Clean a raw google_play_scraper review into a row of the reviews table
+def _clean_review(app_id, review, update_ui=None):
+    for key in ['reviewId', 'userName', 'score', 'content']:
+        field = review.get(key)
+        if isinstance(field, dict):
+            message = f"Nested field found for {key}: {field}"
+            logging.warning(message)
+            if update_ui:
+                update_ui(message)
+        elif not isinstance(field, (str, int, type(None))):
+            message = f"Unexpected type for {key}: {field} (type: {type(field)})"
+            logging.warning(message)
+            if update_ui:
+                update_ui(message)
+    return {
+        'app_id': app_id,
+        'review_id': _extract_value(review.get('reviewId', '')),
+        'username': _extract_value(review.get('userName', '')),
+        'date': review.get('at'),
+        'rating': int(_extract_value(review.get('score', 0), 0)) if review.get('score') is not None else 0,
+        'review_text': _extract_value(review.get('content', ''))
+    }
+
+# Clean, score and tag a batch of raw reviews; returns the batch DataFrame and its extracted tags
+def _analyze_batch(app_id, raw_reviews, update_ui=None):
+    cleaned_reviews = []
+    with span('clean', items=len(raw_reviews)):
+        for review in raw_reviews:
             try:
-                def extract_value(field, default=''):
-                    if isinstance(field, dict) and 'value' in field:
-                        return str(field['value'])
-                    return str(field) if field is not None else default
-
-                cleaned_review = {
-                    'app_id': app_id,
-                    'reviewId': extract_value(review.get('reviewId', '')),
-                    'userName': extract_value(review.get('userName', '')),
-                    'at': review.get('at'),
-                    'score': int(extract_value(review.get('score', 0), 0)) if review.get('score') is not None else 0,
-                    'content': extract_value(review.get('content', ''))
-                }
-                for key in ['reviewId', 'userName', 'score', 'content']:
-                    field = review.get(key)
-                    if isinstance(field, dict):
-                        message = f"Nested field found for {key}: {field}"
-                        logging.warning(message)
-                        if update_ui:
-                            update_ui(message)
-                    elif not isinstance(field, (str, int, type(None))):
-                        message = f"Unexpected type for {key}: {field} (type: {type(field)})"
-                        logging.warning(message)
-                        if update_ui:
-                            update_ui(message)
-                cleaned_reviews.append(cleaned_review)
+                cleaned_reviews.append(_clean_review(app_id, review, update_ui))
             except Exception as e:
                 message = f"Error processing review: {review}, Error: {e}"
                 logging.error(message)
                 if update_ui:
                     update_ui(message)
-                continue
+        batch = pd.DataFrame(cleaned_reviews, columns=CLEANED_COLUMNS)
 
-        if not cleaned_reviews:
-            message = "No reviews after cleaning."
-            if update_ui:
-                update_ui(message)
-            return None, message
+    sentiments, scores, extracted_by_review = analyze_reviews(batch['review_text'].tolist(), get_cached_analyses,
+                                                              save_cached_analyses)
+    batch['sentiment'] = sentiments
+    batch['sentiment_score'] = scores
 
-        message = f"Sample review data (cleaned): {cleaned_reviews[0]}"
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+    tag_matcher = get_tag_matcher(app_id)
+    all_extracted_tags = set()
+    review_tags = []
+    with span('tag_match', items=len(batch)):
+        for review_text, extracted_tags in zip(batch['review_text'], extracted_by_review):
+            if not review_text:
+                review_tags.append(None)
+                continue
+            tags = tag_matcher.match(review_text)
+            tags.update(extracted_tags)
+            all_extracted_tags.update(extracted_tags)
+            review_tags.append(','.join(tags) if tags else None)
+    batch['tags'] = review_tags
+    return batch, all_extracted_tags
 
-        message = "Converting to DataFrame..."
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
-        new_reviews = pd.DataFrame(cleaned_reviews)
-        message = "DataFrame conversion complete."
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+# Format a timestamp the way dates are stored in the database
+def _format_date(timestamp):
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp is not None else None
 
-        new_reviews = new_reviews.rename(columns={
-            'reviewId': 'review_id',
-            'userName': 'username',
-            'at': 'date',
-            'score': 'rating',
-            'content': 'review_text'
-        })
-        required_columns = ['app_id', 'review_id', 'username', 'date', 'rating', 'review_text']
-        new_reviews = new_reviews[required_columns]
-
-        new_reviews['sentiment'] = None
-        new_reviews['sentiment_score'] = None
-        new_reviews['tags'] = None
-
-        message = "Analyzing sentiment..."
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
-        for idx, row in new_reviews.iterrows():
+# Put an item on a bounded stage queue; gives up and returns False once the pipeline is stopped
+def _put(stage_queue, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+# Fetch stage: group fetched pages into batches of about batch_size raw reviews. Each batch is
+# passed on as (raw_reviews, page_count, continuation_token) so the writer can checkpoint it.
+# Ends with _STAGE_DONE, or with the exception that stopped the fetch. reached_end is set when the
+# fetch provably got to the end of the Play Store's review list.
+def _fetch_stage(app_id, fetch_kwargs, raw_batches, messages, stop_event, batch_size, reached_end):
+    batch, pages, token = [], 0, None
+    try:
+        review_pages = iter_review_pages(app_id, update_ui=messages.put, **fetch_kwargs)
+        while True:
             try:
-                sentiment, score = analyze_sentiment(row['review_text'])
-                new_reviews.at[idx, 'sentiment'] = sentiment
-                new_reviews.at[idx, 'sentiment_score'] = score
-            except Exception as e:
-                message = f"Error analyzing sentiment for review {idx}: {e}"
-                logging.error(message)
-                if update_ui:
-                    update_ui(message)
-                new_reviews.at[idx, 'sentiment'] = 'Neutral'
-                new_reviews.at[idx, 'sentiment_score'] = 0.0
-        message = "Sentiment analysis complete."
-        logging.info(message)
+                page, continuation_token = next(review_pages)
+            except StopIteration as stop:
+                if stop.value:
+                    reached_end.set()
+                break
+            batch.extend(page)
+            pages += 1
+            token = dump_continuation_token(continuation_token)
+            if len(batch) >= batch_size:
+                if not _put(raw_batches, (batch, pages, token), stop_event):
+                    return
+                batch, pages = [], 0
+        if batch and not _put(raw_batches, (batch, pages, token), stop_event):
+            return
+        _put(raw_batches, _STAGE_DONE, stop_event)
+    except Exception as e:
+        if batch and not _put(raw_batches, (batch, pages, token), stop_event):
+            return
+        _put(raw_batches, e, stop_event)
+
+# Analyze stage: clean, score and tag each raw batch and pass it on to the writer
+def _analyze_stage(app_id, raw_batches, analyzed_batches, messages, stop_event):
+    while not stop_event.is_set():
+        try:
+            item = raw_batches.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _STAGE_DONE or isinstance(item, Exception):
+            _put(analyzed_batches, item, stop_event)
+            return
+        raw_reviews, pages, token = item
+        try:
+            batch, extracted_tags = _analyze_batch(app_id, raw_reviews, update_ui=messages.put)
+        except Exception as e:
+            message = f"Error analyzing reviews: {e}"
+            logging.error(message)
+            _put(analyzed_batches, e, stop_event)
+            return
+        if not _put(analyzed_batches, (batch, extracted_tags, pages, token), stop_event):
+            return
+
+# Forward progress messages queued by the worker stages to the UI callback (from the calling thread)
+def _drain_messages(messages, update_ui):
+    while True:
+        try:
+            message = messages.get_nowait()
+        except queue.Empty:
+            return
         if update_ui:
             update_ui(message)
 
-        message = "Auto-tagging and extracting tags from reviews..."
+# Fetch reviews, analyze sentiment, and auto-tag, with UI updates.
+# Fetching, analysis and DB writes run as a streaming pipeline over bounded queues, so memory
+# stays flat and every batch is committed as soon as it is analyzed.
+# With incremental=True only reviews newer than the stored high-water mark are fetched and
+# new or changed rows are upserted; otherwise every review is rewritten and reviews that are
+# no longer on the Play Store are pruned, but only if the fetch reached the end of the list.
+# Each batch is committed together with a checkpoint (continuation token and progress), so with
+# resume=True a refresh that was interrupted picks up where it stopped instead of starting over.
+# When run as a refresh job, the job's lease is renewed with every saved batch.
+def refresh_reviews(app_id='cashgiraffe.app', update_ui=None, incremental=False,
+                    batch_size=PIPELINE_BATCH_SIZE, queue_size=PIPELINE_QUEUE_SIZE, resume=True, job_id=None):
+    try:
+        start_time = time.perf_counter()
+        mode = 'incremental' if incremental else 'full'
+        checkpoint = get_fetch_checkpoint(app_id, mode, FETCH_CHECKPOINT_MAX_AGE_HOURS) if resume else None
+
+        fetch_kwargs = {'batch_size': 100}
+        fetched, pages, written = 0, 0, 0
+        newest_review_id, newest_date = None, None
+        stop_at_review_id, last_review_at = None, None
+        if checkpoint:
+            fetch_kwargs['continuation_token'] = load_continuation_token(checkpoint['continuation_token'])
+            fetched, pages = checkpoint['reviews'], checkpoint['pages']
+            newest_review_id = checkpoint['newest_review_id']
+            if checkpoint['newest_review_at']:
+                newest_date = pd.Timestamp(checkpoint['newest_review_at'])
+            stop_at_review_id, last_review_at = checkpoint['stop_at_review_id'], checkpoint['stop_at_date']
+        elif incremental:
+            stop_at_review_id, last_review_at = get_fetch_state(app_id)
+        else:
+            clear_fetch_checkpoint(app_id, mode)
+            begin_full_refresh(app_id)
+
+        if incremental:
+            fetch_kwargs['stop_at_review_id'] = stop_at_review_id
+            if last_review_at:
+                fetch_kwargs['stop_at_date'] = pd.Timestamp(last_review_at).to_pydatetime()
+            message = f"Incremental refresh: fetching reviews newer than {last_review_at or 'the beginning'}."
+        else:
+            message = "Full refresh: fetching all reviews."
+        if checkpoint:
+            message += f" Resuming after {pages} pages ({fetched} reviews) already saved."
+        message = ProgressEvent(message, 'refresh_start', app_id=app_id, mode=mode, resumed_pages=pages,
+                                resumed_reviews=fetched)
         logging.info(message)
         if update_ui:
             update_ui(message)
-        tag_rules = load_tag_rules(app_id)
-        for idx, row in new_reviews.iterrows():
-            try:
-                if row['review_text']:
-                    review_text_lower = row['review_text'].lower()
-                    tags = set()
-                    for tag, keywords in tag_rules.items():
-                        if any(keyword in review_text_lower for keyword in keywords):
-                            tags.add(tag)
-                    extracted_tags = extract_tags_from_review(row['review_text'])
-                    for tag in extracted_tags:
-                        tags.add(tag)
-                        add_extracted_tag(app_id, tag)
-                    new_reviews.at[idx, 'tags'] = ','.join(tags) if tags else None
-                else:
-                    new_reviews.at[idx, 'tags'] = None
-            except Exception as e:
-                message = f"Error tagging review {idx}: {e}"
-                logging.error(message)
+
+        raw_batches = queue.Queue(maxsize=queue_size)
+        analyzed_batches = queue.Queue(maxsize=queue_size)
+        messages = queue.Queue()
+        stop_event = threading.Event()
+        reached_end = threading.Event()
+        stages = [
+            threading.Thread(target=_fetch_stage, daemon=True, name=f"fetch-{app_id}",
+                             args=(app_id, fetch_kwargs, raw_batches, messages, stop_event, batch_size, reached_end)),
+            threading.Thread(target=_analyze_stage, daemon=True, name=f"analyze-{app_id}",
+                             args=(app_id, raw_batches, analyzed_batches, messages, stop_event)),
+        ]
+        for stage in stages:
+            stage.start()
+
+        error = None
+        try:
+            while True:
+                try:
+                    item = analyzed_batches.get(timeout=0.1)
+                except queue.Empty:
+                    _drain_messages(messages, update_ui)
+                    continue
+                _drain_messages(messages, update_ui)
+                if item is _STAGE_DONE:
+                    break
+                if isinstance(item, Exception):
+                    error = item
+                    break
+
+                batch, extracted_tags, batch_pages, token = item
+                batch_dates = pd.to_datetime(batch['date'])
+                if batch_dates.notnull().any() and (newest_date is None or batch_dates.max() > newest_date):
+                    newest_date = batch_dates.max()
+                    newest_review_id = batch.loc[batch_dates.idxmax(), 'review_id']
+                with transaction():
+                    written += save_reviews(app_id, batch, full_refresh=not incremental)
+                    add_extracted_tags(app_id, extracted_tags)
+                    save_fetch_checkpoint(app_id, mode, token, pages + batch_pages, fetched + len(batch),
+                                          newest_review_id, _format_date(newest_date),
+                                          stop_at_review_id, last_review_at)
+                    if job_id is not None:
+                        renew_refresh_job(job_id)
+                fetched += len(batch)
+                pages += batch_pages
+                message = ProgressEvent(f"Saved batch of {len(batch)} reviews. Total processed: {fetched}", 'batch_saved',
+                                        app_id=app_id, batch_reviews=len(batch), processed=fetched, saved=written,
+                                        pages=pages)
+                logging.info(message)
                 if update_ui:
                     update_ui(message)
-                new_reviews.at[idx, 'tags'] = None
-        message = "Auto-tagging and extraction complete."
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+        finally:
+            stop_event.set()
+        for stage in stages:
+            stage.join()
+        _drain_messages(messages, update_ui)
 
-        message = f"Sample DataFrame row with sentiment and tags: {new_reviews.iloc[0].to_dict()}"
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+        if error is not None:
+            message = ProgressEvent(f"Refresh of {app_id} stopped after saving {written} new or changed reviews "
+                                    f"({fetched} processed); the next refresh will resume from here: {error}",
+                                    'refresh_interrupted', app_id=app_id, processed=fetched, saved=written,
+                                    error=str(error))
+            logging.error(message)
+            if update_ui:
+                update_ui(message)
+            return None, message
 
-        message = "Updating database..."
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
-        init_db()
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM reviews WHERE app_id = ?", (app_id,))
-        new_reviews.to_sql('reviews', conn, if_exists='append', index=False)
-        conn.commit()
-        conn.close()
-        message = "Database update complete."
-        logging.info(message)
-        if update_ui:
-            update_ui(message)
+        prune = fetched and not incremental
+        if prune and not reached_end.is_set():
+            prune = False
+            message = "The fetch stopped before the end of the review list; not pruning unseen reviews."
+            logging.warning(message)
+            if update_ui:
+                update_ui(message)
+        with transaction():
+            pruned = prune_unseen_reviews(app_id) if prune else 0
+            if newest_review_id is not None:
+                save_fetch_state(app_id, newest_review_id, _format_date(newest_date))
+            clear_fetch_checkpoint(app_id, mode)
+        evict_analysis_cache(ANALYSIS_CACHE_MAX_ENTRIES)
+        observe('refresh', time.perf_counter() - start_time, fetched)
 
-        clear_reviews_cache()
+        if not fetched:
+            message = NO_NEW_REVIEWS_MESSAGE
+            if update_ui:
+                update_ui(message)
+            return None, message
 
-        message = f"Successfully fetched and saved {len(new_reviews)} reviews with sentiment and tags for app {app_id}!"
-        return new_reviews, message
+        summary = {'app_id': app_id, 'fetched': fetched, 'saved': written, 'pruned': pruned}
+        message = (f"Successfully fetched {fetched} reviews and saved {written} new or changed "
+                   f"reviews with sentiment and tags for app {app_id}!")
+        return summary, message
     except Exception as e:
         message = f"Error refreshing reviews: {e}"
         logging.error(message)